@@ -2,7 +2,10 @@
 from __future__ import annotations
 
 import functools
+import hashlib
+import importlib
 import os
+import re
 import shlex
 import subprocess  # nosec:B404
 import sys
@@ -13,12 +16,23 @@ from pathlib import Path
 from typing import TYPE_CHECKING, Annotated, Any
 
 import anyio
+import httpx
 import typer
 from rich.progress import Progress, SpinnerColumn, TaskID
 
-from .client import CdnHostBuilder, HttpSniff
+from .client import (
+    AssetStore,
+    CdnHostBuilder,
+    HttpSniff,
+    StaticIndex,
+    compress,
+    patch_docs,
+)
+from .utils import TestClient
 
 if TYPE_CHECKING:
+    from fastapi import FastAPI
+
     if sys.version_info >= (3, 11):
         from typing import Self
     else:
@@ -201,25 +215,193 @@ async def download_offline_assets(dirname: str | Path, timeout: float = 30) -> N
             relative_path = p.relative_to(cwd)
             typer.echo(f"{relative_path} already exists. abort!")
             return
-    async with percentbar("Comparing cdn hosts response speed"):
-        urls = await CdnHostBuilder.sniff_the_fastest()
-    typer.echo(f"Result: {urls}")
-    with spinnerbar("Fetching files from cdn", color="yellow"):
-        url_list = [urls.js, urls.css, urls.redoc]
-        contents = await HttpSniff.bulk_fetch(
-            url_list, get_content=True, total_seconds=timeout
-        )
-        for url, content in zip(url_list, contents, strict=False):
-            if not content:
-                red_head = typer.style("ERROR:", fg=typer.colors.RED)
-                typer.echo(red_head + f" Failed to fetch content from {url}")
-            else:
-                path = static_root / Path(url).name
-                size = await path.write_bytes(content)
-                typer.echo(f"Write to {path} with {size=}")
+    store = AssetStore()
+    version = CdnHostBuilder.swagger_ui_full_version
+    names = [*CdnHostBuilder.swagger_files.values(), CdnHostBuilder.redoc_file]
+    if (files := store.lookup(version, names)) is None:
+        files = await fetch_assets_to_store(store, timeout)
+        store.record(version, files)
+    else:
+        typer.echo(f"Use files of swagger-ui {version} from {store.root}")
+    for name, digest in files.items():
+        path = static_root / name
+        how = store.link(digest, Path(path))
+        typer.echo(f"Link {path} ({how})")
+    kinds = {**CdnHostBuilder.swagger_files, "redoc": CdnHostBuilder.redoc_file}
+    manifest = {kind: name if name in files else None for kind, name in kinds.items()}
+    favicon = StaticIndex.scan(Path(static_root)).latest("favicon")
+    manifest["favicon"] = (
+        favicon.relative_to(static_root).as_posix() if favicon else None
+    )
+    manifest_file = StaticIndex.write_manifest(Path(static_root), manifest)
+    typer.echo(f"Write {manifest_file}")
     typer.secho("Done.", fg=typer.colors.GREEN)
 
 
+async def fetch_assets_to_store(store: AssetStore, timeout: float) -> dict[str, str]:
+    """Download assets from the fastest cdn host, return {filename: sha256}"""
+    files: dict[str, str] = {}
+    async with HttpSniff.client_provider.session(timeout):
+        async with percentbar("Comparing cdn hosts response speed"):
+            urls = await CdnHostBuilder.sniff_the_fastest()
+        typer.echo(f"Result: {urls}")
+        with spinnerbar("Fetching files from cdn", color="yellow"):
+            url_list = [urls.js, urls.css, urls.redoc]
+            contents = await HttpSniff.bulk_fetch(
+                url_list, get_content=True, total_seconds=timeout
+            )
+            for url, content in zip(url_list, contents, strict=False):
+                if not content:
+                    red_head = typer.style("ERROR:", fg=typer.colors.RED)
+                    typer.echo(red_head + f" Failed to fetch content from {url}")
+                else:
+                    files[Path(url).name] = digest = store.add(content)
+                    typer.echo(f"Save {url} to store as {digest[:12]}")
+    return files
+
+
+def load_app(path: str | Path) -> FastAPI:
+    """Import `app` from python file, and patch its docs if not patched yet"""
+    path = Path(path).resolve()
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    application = importlib.import_module(path.stem).app
+    endpoints = [getattr(r, "endpoint", None) for r in application.routes]
+    if not any(
+        getattr(f, "__module__", "") == patch_docs.__module__ for f in endpoints
+    ):
+        patch_docs(application)
+    return application
+
+
+class SiteExporter:
+    """Render docs pages of app into a directory that can be served by
+    nginx or object storage
+
+    - Pages are written to '<docs_url>/index.html' and '<redoc_url>/index.html',
+      so is the oauth2 redirect page of swagger-ui
+    - Openapi documents are written with precompressed '.gz'('.br') variants
+    - Assets are renamed with content hash, so they can be cached forever;
+      the ones from cdn are downloaded to '/assets/<host>/<path>'
+    """
+
+    asset_pattern = re.compile(r'(?:href|src)="((?:https?:)?/[^"]+)"')
+    spec_pattern = re.compile(r"""['"](/[^'"]+\.json)['"]""")
+
+    def __init__(self, app: FastAPI, out: Path, timeout: float = 30) -> None:
+        self.app = app
+        self.out = out
+        self.timeout = timeout
+
+    @staticmethod
+    def local_path(url: str) -> str:
+        """Usage::
+        >>> SiteExporter.local_path('https://unpkg.com/redoc@2/bundles/redoc.standalone.js')
+        '/assets/unpkg.com/redoc@2/bundles/redoc.standalone.js'
+        >>> SiteExporter.local_path('/static/swagger-ui.css')
+        '/static/swagger-ui.css'
+        """
+        if url.startswith("/") and not url.startswith("//"):
+            return url
+        u = httpx.URL(url if "://" in url else "https:" + url)
+        return f"/assets/{u.host}{u.path}"
+
+    @staticmethod
+    def hashed_name(path: str, content: bytes) -> str:
+        """Usage::
+        >>> SiteExporter.hashed_name('/static/swagger-ui.css', b'')
+        '/static/swagger-ui.e3b0c442.css'
+        """
+        digest = hashlib.sha256(content).hexdigest()[:8]
+        stem, dot, suffix = path.rpartition(".")
+        return f"{stem}.{digest}.{suffix}" if dot and "/" not in suffix else path
+
+    def write(self, url_path: str, content: bytes) -> Path:
+        dest = self.out / url_path.lstrip("/")
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(content)
+        typer.echo(f"Write {dest}")
+        return dest
+
+    @staticmethod
+    async def fetch(
+        client: httpx.AsyncClient, url: str, required: bool = True
+    ) -> bytes:
+        """Get content of url, an empty bytes for missing asset"""
+        try:
+            response = await client.get(url)
+        except httpx.HTTPError as e:
+            msg = f" Failed to fetch {url}: {e!r}"
+        else:
+            if response.status_code == 200:
+                return response.content
+            msg = f" {url} responded {response.status_code}"
+        head = "ERROR:" if required else "WARNING:"
+        color = typer.colors.RED if required else typer.colors.YELLOW
+        typer.echo(typer.style(head, fg=color) + msg)
+        if required:
+            raise typer.Exit(1)
+        return b""
+
+    async def fetch_asset(
+        self, client: httpx.AsyncClient, remote: httpx.AsyncClient, url: str
+    ) -> bytes:
+        if self.local_path(url) == url:
+            return await self.fetch(client, url, required=False)
+        if url.startswith("//"):
+            url = "https:" + url
+        return await self.fetch(remote, url, required=False)
+
+    async def export(self) -> list[Path]:
+        docs_url = getattr(self.app, "docs_url", "")
+        page_urls = [
+            url
+            for url in (
+                docs_url,
+                # FastAPI serves it only when docs_url is set
+                docs_url and getattr(self.app, "swagger_ui_oauth2_redirect_url", ""),
+                getattr(self.app, "redoc_url", ""),
+            )
+            if url
+        ]
+        written: list[Path] = []
+        specs: dict[str, None] = {}
+        if openapi_url := getattr(self.app, "openapi_url", ""):
+            specs[openapi_url] = None
+        async with (
+            TestClient(self.app) as client,
+            HttpSniff.client_provider.session(self.timeout) as remote,
+        ):
+            assets: dict[str, str] = {}
+            for page_url in page_urls:
+                html = (await self.fetch(client, page_url)).decode()
+                specs.update(dict.fromkeys(self.spec_pattern.findall(html)))
+                for url in self.asset_pattern.findall(html):
+                    if url not in assets:
+                        content = await self.fetch_asset(client, remote, url)
+                        if not content:
+                            assets[url] = url  # Keep it as is
+                            continue
+                        assets[url] = self.hashed_name(self.local_path(url), content)
+                        written.append(self.write(assets[url], content))
+                    html = html.replace(f'"{url}"', f'"{assets[url]}"')
+                index = page_url.rstrip("/") + "/index.html"
+                written.append(self.write(index, html.encode()))
+            for spec_url in specs:
+                content = await self.fetch(client, spec_url)
+                written.append(self.write(spec_url, content))
+                for encoding, body in compress(content).items():
+                    suffix = ".gz" if encoding == "gzip" else "." + encoding
+                    written.append(self.write(spec_url + suffix, body))
+        return written
+
+
+async def export_site(app_file: str | Path, out: Path) -> None:
+    with spinnerbar(f"Exporting docs of {app_file}", color="yellow"):
+        paths = await SiteExporter(load_app(app_file), out).export()
+    typer.secho(f"Done. {len(paths)} files exported to {out}", fg=typer.colors.GREEN)
+
+
 def handle_cache() -> None:
     exists, cache_path = CdnHostBuilder.get_cache_file()
     if not exists:
@@ -239,8 +421,9 @@ def handle_cache() -> None:
             typer.echo(f"Cache file updated:\n{cache_path.read_text()}")
 
 
-@app.command()
+@app.command(context_settings={"allow_extra_args": True})
 def dev(
+    ctx: typer.Context,
     path: Annotated[
         Path,
         typer.Argument(
@@ -277,6 +460,10 @@ def dev(
         bool,
         typer.Option(help="Enable auto-reload of the server when (code) files change."),
     ] = True,
+    out: Annotated[
+        Path,
+        typer.Option(help="Output directory of `fastcdn export <app_file>`."),
+    ] = Path("site"),
 ) -> None:
     if str(path) == "offline":
         anyio.run(download_offline_assets, "static")
@@ -284,6 +471,10 @@ def dev(
     elif str(path) == "cache":
         handle_cache()
         return
+    elif str(path) == "export":
+        app_file = ctx.args[0] if ctx.args else "main.py"
+        anyio.run(export_site, app_file, out)
+        return
     with patch_app(path, remove) as file:
         runserver(file, prod, reload, port)
 
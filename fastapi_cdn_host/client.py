@@ -1,34 +1,58 @@
 from __future__ import annotations
 
 import contextlib
+import fnmatch
 import functools
+import gzip
+import hashlib
+import importlib.util
 import inspect
+import json
 import logging
 import math
+import operator
 import os
 import re
+import ssl
 import sys
-from collections.abc import Awaitable, Callable, Iterable
-from dataclasses import dataclass
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Mapping,
+)
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field, replace
+from email.utils import formatdate, parsedate_to_datetime
 from enum import Enum
+from html import escape
 from pathlib import Path
 from ssl import SSLError
-from typing import Annotated, Any, Literal, TypeVar, cast, overload
+from typing import Annotated, Any, ClassVar, Literal, TypeVar, cast, overload
+from urllib.parse import quote, urlencode
 
 import anyio
 import httpx
-from anyio import from_thread
-from fastapi import FastAPI, Request
+from anyio import from_thread, to_thread
+from anyio.lowlevel import RunVar
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.datastructures import URL
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.routing import APIRoute, Mount
 from fastapi.staticfiles import StaticFiles
 
+from .utils import ParamLock, TodayLock, WeekdayLock, today_lock, weekday_lock
+
 if sys.version_info >= (3, 11):
-    from typing import ParamSpec, Self, TypeVarTuple, Unpack
+    from typing import Self, TypeVarTuple, Unpack
 else:
-    from typing_extensions import ParamSpec, Self, TypeVarTuple, Unpack
+    from typing_extensions import Self, TypeVarTuple, Unpack
 
 logger = logging.getLogger("fastapi-cdn-host")
 
@@ -49,7 +73,8 @@ CdnHostInfoType = (
 T_Retval = TypeVar("T_Retval")
 PosArgsT = TypeVarTuple("PosArgsT")
 LockFunc = Callable[[Request], Any]
-P = ParamSpec("P")
+ProbeMethod = Literal["head", "range"]
+RaceScore = Literal["p50", "p95", "throughput"] | Callable[["HostStats"], float]
 
 
 class CdnHostItem:
@@ -140,7 +165,7 @@ class CdnHostEnum(Enum):
 DocsCdnHostType = Path | CdnHostEnum | str | list[CdnHostInfoType] | CdnHostInfoType
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AssetUrl:
     css: Annotated[str, "URL of swagger-ui.css"]
     js: Annotated[str, "URL of swagger-ui-bundle.js"]
@@ -148,8 +173,631 @@ class AssetUrl:
     favicon: Annotated[str | None, "URL of favicon.png/favicon.ico"] = None
 
 
+@dataclass
+class RaceCache:
+    """Race result that saved to disk, so that next startup need not race again"""
+
+    css: str
+    js: str
+    redoc: str
+    fingerprint: Annotated[str, "Hash of candidates and swagger-ui version"]
+    swagger_ui_version: str
+    created_at: float = field(default_factory=time.time)
+    ttl: Annotated[float, "Seconds that the record keeps valid"] = 7 * 24 * 3600
+    scores: Annotated[dict[str, float], "Seconds cost by each url"] = field(
+        default_factory=dict
+    )
+    version: int = 1
+    soft_ttl: Annotated[
+        float | None, "Seconds after which the record is served but raced again"
+    ] = None
+
+    VERSION: ClassVar[int] = 1
+
+    @property
+    def expired(self) -> bool:
+        return time.time() > self.created_at + self.ttl
+
+    @property
+    def stale(self) -> bool:
+        return (
+            self.soft_ttl is not None and time.time() > self.created_at + self.soft_ttl
+        )
+
+    def match(
+        self, fingerprint: str, swagger_ui_version: str, allow_expired: bool = False
+    ) -> bool:
+        """Whether this record can be used by the given race"""
+        return (
+            self.version == self.VERSION
+            and self.fingerprint == fingerprint
+            and self.swagger_ui_version == swagger_ui_version
+            and (allow_expired or not self.expired)
+        )
+
+    def to_asset_url(self, favicon: str | None = None) -> AssetUrl:
+        return AssetUrl(css=self.css, js=self.js, redoc=self.redoc, favicon=favicon)
+
+
+@dataclass
+class RaceCacheStore:
+    """Race records of different candidate sets, keyed by fingerprint,
+    so that apps with different cdn choices can share one cache file
+
+    Usage::
+        >>> store = RaceCacheStore()
+        >>> store.put(RaceCache('a.css', 'a.js', 'a.redoc.js', 'fp', '5.0.0'))
+        >>> store.get('fp', '5.0.0').css, store.get('other', '5.0.0')
+        ('a.css', None)
+    """
+
+    entries: dict[str, RaceCache] = field(default_factory=dict)
+    version: int = RaceCache.VERSION
+
+    MAX_ENTRIES: ClassVar[int] = 32
+
+    def get(
+        self, fingerprint: str, swagger_ui_version: str, allow_expired: bool = False
+    ) -> RaceCache | None:
+        """Record of fingerprint, expired one is returned only if allow_expired"""
+        if (record := self.entries.get(fingerprint)) is not None and record.match(
+            fingerprint, swagger_ui_version, allow_expired
+        ):
+            return record
+        return None
+
+    def put(self, record: RaceCache) -> None:
+        """Add or replace record, drop expired and the oldest ones if too many"""
+        entries = {k: v for k, v in self.entries.items() if not v.expired}
+        entries.pop(record.fingerprint, None)
+        entries[record.fingerprint] = record
+        while len(entries) > self.MAX_ENTRIES:
+            oldest = min(entries, key=lambda k: entries[k].created_at)
+            entries.pop(oldest)
+        self.entries = entries
+
+    def dumps(self) -> str:
+        data = {
+            "version": self.version,
+            "entries": {k: asdict(v) for k, v in self.entries.items()},
+        }
+        return json.dumps(data, indent=2)
+
+    @classmethod
+    def loads(cls, text: str) -> RaceCacheStore:
+        """Parse json text, raise ValueError/TypeError if it is not a store.
+        Invalid entries are skipped, so that one bad record won't drop the others.
+        """
+        data = json.loads(text)
+        if not isinstance(data, dict) or not isinstance(
+            entries := data.get("entries"), dict
+        ):
+            raise TypeError("Expect a json object with 'entries' field")
+        if data.get("version") != RaceCache.VERSION:
+            raise ValueError(f"Unsupported cache version: {data.get('version')}")
+        store = cls()
+        for key, value in entries.items():
+            try:
+                record = RaceCache(**value)
+            except TypeError:
+                continue
+            if record.fingerprint == key:
+                store.entries[key] = record
+        return store
+
+
+class CacheFileLock:
+    """Advisory lock across processes, to make sure that only one worker
+    races when several ones start with a cold cache at the same time
+
+    Usage::
+        >>> import tempfile
+        >>> file = Path(tempfile.mkdtemp()) / 'race.json'
+        >>> with CacheFileLock(file, timeout=1) as lock:
+        ...     lock.path.name
+        'race.json.lock'
+    """
+
+    def __init__(self, file: Path, timeout: float = 30, poll: float = 0.05) -> None:
+        self.path = file.with_name(file.name + ".lock")
+        self.timeout = timeout
+        self.poll = poll
+        self._fd: int | None = None
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        if sys.platform == "win32":
+            import msvcrt
+
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self) -> None:
+        """Block until got the lock, raise TimeoutError if waited too long"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while not self._try_lock(fd):
+            if time.monotonic() > deadline:
+                os.close(fd)
+                raise TimeoutError(f"Failed to lock {self.path} in {self.timeout}s")
+            time.sleep(self.poll)
+        self._fd = fd
+
+    def release(self) -> None:
+        if (fd := self._fd) is not None:
+            self._fd = None
+            try:
+                self._unlock(fd)
+            finally:
+                os.close(fd)
+
+    def __enter__(self) -> Self:
+        self.acquire()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.release()
+
+
+class AssetStore:
+    """Content-addressed store of downloaded swagger-ui/redoc files,
+    shared by all projects of the machine to avoid fetching them again
+
+    Layout::
+        <root>/blobs/<sha256[:2]>/<sha256>
+        <root>/index.json  # {swagger_ui_full_version: {filename: sha256}}
+    """
+
+    def __init__(self, root: Path | None = None) -> None:
+        if root is None:
+            _, cache_file = CdnHostBuilder.get_cache_file()
+            root = cache_file.parent / "assets"
+        self.root = root
+        self.index_file = root / "index.json"
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / digest
+
+    def is_intact(self, digest: str) -> bool:
+        """Whether blob exists and was not edited through one of its hardlinks"""
+        try:
+            content = self.blob_path(digest).read_bytes()
+        except OSError:
+            return False
+        return hashlib.sha256(content).hexdigest() == digest
+
+    def add(self, content: bytes) -> str:
+        """Save content if not exists(or was edited), return its sha256"""
+        digest = hashlib.sha256(content).hexdigest()
+        if not self.is_intact(digest):
+            blob = self.blob_path(digest)
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f".{digest}.{os.getpid()}.tmp")
+            tmp.write_bytes(content)
+            os.replace(tmp, blob)
+        return digest
+
+    def _read_index(self) -> dict[str, dict[str, str]]:
+        try:
+            data = json.loads(self.index_file.read_text("utf8"))
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def lookup(self, version: str, names: Iterable[str]) -> dict[str, str] | None:
+        """Digests of the files of the version, None if any of them is missing"""
+        files = self._read_index().get(version) or {}
+        result = {}
+        for name in names:
+            if not (digest := files.get(name)) or not self.is_intact(digest):
+                return None
+            result[name] = digest
+        return result
+
+    def record(self, version: str, files: dict[str, str]) -> None:
+        with CacheFileLock(self.index_file):
+            index = self._read_index()
+            index[version] = {**index.get(version, {}), **files}
+            tmp = self.index_file.with_name(f".index.json.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(index, indent=2), "utf8")
+            os.replace(tmp, self.index_file)
+
+    def link(self, digest: str, dest: Path) -> Literal["hardlink", "copy"]:
+        """Hardlink blob to dest, fallback to copy (e.g.: across filesystems)"""
+        blob = self.blob_path(digest)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(blob, dest)
+        except OSError:
+            dest.write_bytes(blob.read_bytes())
+            return "copy"
+        return "hardlink"
+
+
+class AssetUrlHolder:
+    """Reference of the AssetUrl that used by docs handlers,
+    so that the race result can be swapped in after routes installed
+
+    Usage::
+        >>> holder = AssetUrlHolder()
+        >>> holder.set_default(AssetUrl(css='a.css', js='a.js', redoc='a.redoc.js'))
+        >>> holder.swap(AssetUrl(css='b.css', js='b.js', redoc='b.redoc.js'))
+        >>> holder.set_default(AssetUrl(css='c.css', js='c.js', redoc='c.redoc.js'))
+        >>> holder.urls.css, holder.ready.is_set()
+        ('b.css', True)
+    """
+
+    def __init__(self, urls: AssetUrl | None = None) -> None:
+        self._urls = urls
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+
+    @property
+    def urls(self) -> AssetUrl:
+        if self._urls is None:
+            raise RuntimeError("AssetUrl is not provided yet")
+        return self._urls
+
+    @property
+    def current(self) -> AssetUrl | None:
+        return self._urls
+
+    def swap(self, urls: AssetUrl) -> None:
+        """Replace current urls with the final one(e.g.: race result)"""
+        with self._lock:
+            self._urls = urls
+            self.ready.set()
+
+    def set_default(self, urls: AssetUrl) -> None:
+        """Use urls as provisional one if the final one not arrived yet"""
+        with self._lock:
+            if self._urls is None:
+                self._urls = urls
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linear interpolated percentile of values, q should be in range [0, 100]
+
+    Usage::
+        >>> percentile([3, 1, 2], 50)
+        2.0
+        >>> percentile([1, 2, 3, 4], 95)
+        3.85
+    """
+    if not values:
+        return math.inf
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    low = math.floor(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+@dataclass
+class PhaseTimings:
+    """Seconds cost by each phase of a request, None means not happened
+
+    `connect` and `tls` are None when the request reused a keep-alive connection.
+    """
+
+    dns: Annotated[float | None, "Resolve hostname by getaddrinfo"] = None
+    connect: Annotated[float | None, "Establish TCP connection"] = None
+    tls: Annotated[float | None, "TLS handshake"] = None
+    ttfb: Annotated[float | None, "From sending request to receiving headers"] = None
+    transfer: Annotated[float | None, "Receive the (probe) body"] = None
+
+    @classmethod
+    def from_trace(
+        cls, events: dict[str, float], dns: float | None = None
+    ) -> PhaseTimings:
+        """Build from timestamps of httpcore trace events,
+        e.g.: {'connect_tcp.started': 1.0, 'connect_tcp.complete': 1.2}
+
+        As `connect_tcp` of httpcore resolves hostname too, the separately
+        measured `dns` is subtracted from it.
+
+        Usage::
+            >>> events = {'connect_tcp.started': 1.0, 'connect_tcp.complete': 1.25}
+            >>> round(PhaseTimings.from_trace(events, dns=0.05).connect, 3)
+            0.2
+        """
+
+        def cost(start: str, end: str) -> float | None:
+            if (a := events.get(start)) is None or (b := events.get(end)) is None:
+                return None
+            return b - a
+
+        if (connect := cost("connect_tcp.started", "connect_tcp.complete")) is not None:
+            connect = max(connect - (dns or 0), 0)
+        return cls(
+            dns=dns,
+            connect=connect,
+            tls=cost("start_tls.started", "start_tls.complete"),
+            ttfb=cost(
+                "send_request_headers.started", "receive_response_headers.complete"
+            ),
+        )
+
+    @classmethod
+    def median(cls, timings: list[PhaseTimings]) -> PhaseTimings:
+        values: dict[str, float | None] = {}
+        for name in ("dns", "connect", "tls", "ttfb", "transfer"):
+            ts = [v for i in timings if (v := getattr(i, name)) is not None]
+            values[name] = percentile(ts, 50) if ts else None
+        return cls(**values)
+
+    def __str__(self) -> str:
+        parts: list[str] = []
+        for name in ("dns", "connect", "tls", "ttfb", "transfer"):
+            value = getattr(self, name)
+            parts.append(
+                f"{name}=" + ("-" if value is None else f"{value * 1000:.1f}ms")
+            )
+        return " ".join(parts)
+
+
+@dataclass
+class RaceSample:
+    ttfb: Annotated[float, "Seconds cost to receive response headers"]
+    elapsed: Annotated[float, "Seconds cost to receive the (probe) body"]
+    size: Annotated[int, "Bytes of the received body"] = 0
+    phases: Annotated[PhaseTimings | None, "Timing breakdown"] = None
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second of the body transfer"""
+        if not self.size:
+            return 0
+        return self.size / max(self.elapsed - self.ttfb, 1e-6)
+
+
+@dataclass
+class HostStats:
+    url: str
+    samples: list[RaceSample] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def p50(self) -> float:
+        return percentile([i.ttfb for i in self.samples], 50)
+
+    @property
+    def p95(self) -> float:
+        return percentile([i.ttfb for i in self.samples], 95)
+
+    @property
+    def throughput(self) -> float:
+        """Median bytes per second of samples"""
+        if not self.samples:
+            return 0
+        return percentile([i.throughput for i in self.samples], 50)
+
+    @property
+    def phases(self) -> PhaseTimings:
+        """Median seconds of each phase"""
+        return PhaseTimings.median([i.phases for i in self.samples if i.phases])
+
+    def __str__(self) -> str:
+        if not self.samples:
+            return f"{self.url}: failed {self.errors}"
+        summary = (
+            f"{self.url}: p50={self.p50 * 1000:.1f}ms p95={self.p95 * 1000:.1f}ms"
+            f" {self.phases}"
+        )
+        if self.errors:
+            summary += f" errors={len(self.errors)}"
+        return summary
+
+
+@dataclass
+class RaceReport:
+    hosts: list[HostStats]
+    chosen: Annotated[str | None, "URL of the winner"] = None
+
+    @staticmethod
+    def get_scorer(score: RaceScore) -> Callable[[HostStats], float]:
+        """Convert score to be a function that the lower result means the better"""
+        if callable(score):
+            return score
+        if score == "throughput":
+            return lambda h: -h.throughput
+        return cast(Callable[[HostStats], float], operator.attrgetter(score))
+
+    def choose(self, score: RaceScore = "p50") -> str | None:
+        scorer = self.get_scorer(score)
+        if candidates := [h for h in self.hosts if h.samples]:
+            self.chosen = min(candidates, key=scorer).url
+        else:
+            self.chosen = None
+        return self.chosen
+
+    def __getitem__(self, url: str) -> HostStats:
+        for h in self.hosts:
+            if h.url == url:
+                return h
+        raise KeyError(url)
+
+    def log(self, level: int = logging.DEBUG) -> None:
+        for h in self.hosts:
+            logger.log(level, f"{'*' if h.url == self.chosen else ' '} {h}")
+
+
+class BytesCache:
+    """Thread safe LRU cache for response contents, limited by total bytes and TTL
+
+    Usage::
+        >>> cache = BytesCache(max_bytes=5, ttl=60)
+        >>> cache['a'] = b'123'
+        >>> cache['b'] = b'45'
+        >>> cache['c'] = b'6'  # 'a' will be evicted
+        >>> cache.get('a'), cache.get('c'), len(cache), cache.size
+        (None, b'6', 2, 3)
+        >>> cache.hits, cache.misses
+        (1, 1)
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, ttl: float = 3600) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = self.misses = 0
+        self._data: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pop(self, key: str) -> bytes:
+        value, _ = self._data.pop(key)
+        self.size -= len(value)
+        return value
+
+    def get(self, key: str, default: bytes | None = None) -> bytes | None:
+        with self._lock:
+            if (item := self._data.get(key)) is not None:
+                value, expire_at = item
+                if expire_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def __getitem__(self, key: str) -> bytes:
+        if (value := self.get(key)) is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: bytes) -> None:
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            if len(value) > self.max_bytes:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def __contains__(self, key: object) -> bool:
+        with self._lock:
+            item = self._data.get(cast(str, key))
+            return item is not None and item[1] > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = self.hits = self.misses = 0
+
+
+class ClientProvider:
+    """Provide pooled httpx.AsyncClient that shared by cdn race and downloading
+
+    The SSL context is created once and reused by every client.
+    Nested `session()` calls (including the ones in child tasks) reuse the client
+    of the outermost session, which will be closed when the outermost one exits.
+
+    Usage::
+        >>> async def download(urls: list[str]) -> None:
+        ...     async with HttpSniff.client_provider.session(timeout=30):
+        ...         asset_urls = await CdnHostBuilder.sniff_the_fastest()
+        ...         await HttpSniff.bulk_fetch(urls, get_content=True)
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5,
+        http2: bool = False,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30,
+    ) -> None:
+        self.timeout = timeout
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._current: ContextVar[httpx.AsyncClient | None] = ContextVar(
+            "fastapi_cdn_host_client", default=None
+        )
+
+    @functools.cached_property
+    def ssl_context(self) -> ssl.SSLContext:
+        """Built only once, as loading the CA bundle is slow.
+        Same as httpx default, SSL_CERT_FILE/SSL_CERT_DIR are respected"""
+        return httpx.create_ssl_context()
+
+    @functools.cached_property
+    def http2_enabled(self) -> bool:
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 disabled as `h2` not installed: pip install h2")
+            return False
+        return self.http2
+
+    def build(self, timeout: float | None = None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self.timeout if timeout is None else timeout,
+            follow_redirects=True,
+            verify=self.ssl_context,
+            http2=self.http2_enabled,
+            limits=self.limits,
+        )
+
+    @property
+    def current(self) -> httpx.AsyncClient | None:
+        """Client of the running session, None if not inside any session"""
+        if (client := self._current.get()) is not None and not client.is_closed:
+            return client
+        return None
+
+    @contextlib.asynccontextmanager
+    async def session(
+        self, timeout: float | None = None
+    ) -> AsyncGenerator[httpx.AsyncClient, None]:
+        """Reuse the client of outer session, or create a new one and close it
+        when exiting (the timeout only works for the new one)"""
+        if (client := self.current) is not None:
+            yield client
+            return
+        async with self.build(timeout) as client:
+            token = self._current.set(client)
+            try:
+                yield client
+            finally:
+                self._current.reset(token)
+
+
 class HttpSniff:
-    cached: dict[str, bytes] = {}
+    cached = BytesCache()
+    client_provider = ClientProvider()
+    probe_bytes = 1024
 
     @classmethod
     async def fetch(
@@ -171,13 +819,171 @@ class HttpSniff:
             if r.status_code < 300:
                 results[index] = cls.cached[url] = r.content
 
+    @classmethod
+    async def probe(
+        cls,
+        client: httpx.AsyncClient,
+        url: str,
+        results: list[Any],
+        index: int,
+        method: ProbeMethod = "range",
+    ) -> None:
+        """Record the `RaceSample`(time-to-first-byte and phase timings) of url
+        without downloading the whole body
+
+        :param method: 'head' to send a HEAD request,
+            'range' to send a GET request with header `Range: bytes=0-<probe_bytes>`
+        """
+        try:
+            sample = await cls.measure(client, url, method)
+        except (httpx.HTTPError, SSLError):
+            ...
+        else:
+            results[index] = sample
+
+    @classmethod
+    async def measure(
+        cls,
+        client: httpx.AsyncClient,
+        url: str,
+        probe: ProbeMethod | None = "range",
+        probe_bytes: int | None = None,
+        dns: bool = False,
+    ) -> RaceSample:
+        """Request url once and measure its time-to-first-byte and throughput
+
+        :param probe: None to read the whole body, 'range' to read `probe_bytes`,
+            'head' to send HEAD request only.
+        :param probe_bytes: bytes to read for 'range' probe, default to cls.probe_bytes
+        :param dns: whether to measure hostname resolving by an extra getaddrinfo
+        """
+        if probe_bytes is None:
+            probe_bytes = cls.probe_bytes
+        dns_cost = await cls.resolve(url) if dns else None
+        events: dict[str, float] = {}
+
+        async def trace(name: str, info: dict[str, Any]) -> None:
+            # name: 'connection.connect_tcp.started', 'http11.send_request_headers...'
+            events[name.split(".", 1)[-1]] = time.perf_counter()
+
+        extensions = {"trace": trace}
+        start = time.perf_counter()
+        size = 0
+        if probe == "head":
+            r = await client.head(url, extensions=extensions)
+            ttfb = time.perf_counter() - start
+        else:
+            headers = None
+            if probe == "range":
+                headers = {"Range": f"bytes=0-{probe_bytes - 1}"}
+            async with client.stream(
+                "GET", url, headers=headers, extensions=extensions
+            ) as r:
+                ttfb = time.perf_counter() - start
+                if r.status_code < 300:
+                    async for chunk in r.aiter_raw():
+                        size += len(chunk)
+                        if probe is not None and size >= probe_bytes:
+                            break
+        elapsed = time.perf_counter() - start
+        if r.status_code >= 300:
+            raise httpx.HTTPStatusError(
+                f"Status code {r.status_code} for url {url}",
+                request=r.request,
+                response=r,
+            )
+        phases = PhaseTimings.from_trace(events, dns_cost)
+        phases.transfer = elapsed - ttfb
+        return RaceSample(ttfb=ttfb, elapsed=elapsed, size=size, phases=phases)
+
+    @staticmethod
+    async def resolve(url: str) -> float | None:
+        """Return seconds cost to resolve hostname of url, None if failed"""
+        u = httpx.URL(url)
+        start = time.perf_counter()
+        try:
+            await anyio.getaddrinfo(
+                u.host, u.port or (443 if u.scheme == "https" else 80)
+            )
+        except OSError:
+            return None
+        return time.perf_counter() - start
+
+    @classmethod
+    async def race(
+        cls,
+        urls: list[str],
+        samples: int = 3,
+        total_seconds: float = 5,
+        probe: ProbeMethod | None = "range",
+        score: RaceScore = "p50",
+        probe_bytes: int | None = None,
+    ) -> RaceReport:
+        """Take several samples per url and choose the winner by score
+
+        :param samples: how many requests to send to each url
+        :param total_seconds: deadline of the whole race
+        :param score: 'p50'/'p95' for latency, 'throughput' for bytes per second,
+            or a function that receive HostStats and return a float(lower is better)
+        :param probe_bytes: bytes to read for 'range' probe
+        """
+        report = RaceReport([HostStats(url) for url in urls])
+
+        async def sampling(stats: HostStats) -> None:
+            for i in range(samples):
+                try:
+                    sample = await cls.measure(
+                        client, stats.url, probe, probe_bytes, dns=i == 0
+                    )
+                except (httpx.HTTPError, SSLError) as e:
+                    stats.errors.append(f"{type(e).__name__}: {e}")
+                else:
+                    stats.samples.append(sample)
+
+        async with cls.client_provider.session(total_seconds) as client:
+            with anyio.move_on_after(total_seconds):
+                async with anyio.create_task_group() as tg:
+                    for stats in report.hosts:
+                        tg.start_soon(sampling, stats)
+        report.choose(score)
+        report.log()
+        return report
+
     @classmethod
     async def find_fastest_host(
-        cls, urls: list[str], total_seconds: float = 5, loop_interval: float = 0.1
+        cls,
+        urls: list[str],
+        total_seconds: float = 5,
+        loop_interval: float = 0.1,
+        probe: ProbeMethod | None = "range",
+        accept_ms: float | None = None,
+        timings: dict[str, float] | None = None,
+        samples: dict[str, RaceSample] | None = None,
     ) -> str:
+        """Return the url that responds first
+
+        :param accept_ms: if not None, request urls one by one in priority order,
+            start the next one only when the previous one failed or did not respond
+            in this milliseconds, so the race stops as soon as one is fast enough
+        :param timings: if not None, probe seconds of responded urls will be put in
+        :param samples: if not None, probe samples(with phase timings) of
+            responded urls will be put in
+        """
+        stagger = 0 if accept_ms is None else accept_ms / 1000
+        if samples is None:
+            samples = {}
         if us := await cls.bulk_fetch(
-            urls, loop_interval, total_seconds, return_first_completed=True
+            urls,
+            loop_interval,
+            total_seconds,
+            return_first_completed=True,
+            probe=probe,
+            stagger=stagger,
+            timings=timings,
+            samples=samples,
         ):
+            if (sample := samples.get(us[0])) is not None:
+                logger.debug(f"Fastest host {us[0]}: {sample.phases}")
             return us[0]
         return urls[0]
 
@@ -190,6 +996,10 @@ class HttpSniff:
         total_seconds: float = 3,
         return_first_completed: bool = False,
         get_content: Literal[False] = False,
+        probe: ProbeMethod | None = None,
+        stagger: float = 0,
+        timings: dict[str, float] | None = None,
+        samples: dict[str, RaceSample] | None = None,
     ) -> list[str]: ...
 
     @classmethod
@@ -201,6 +1011,10 @@ class HttpSniff:
         total_seconds: float = 3,
         return_first_completed: bool = False,
         get_content: Literal[True] = True,
+        probe: ProbeMethod | None = None,
+        stagger: float = 0,
+        timings: dict[str, float] | None = None,
+        samples: dict[str, RaceSample] | None = None,
     ) -> list[bytes]: ...
 
     @classmethod
@@ -211,23 +1025,75 @@ class HttpSniff:
         total_seconds: float = 3,
         return_first_completed: bool = False,
         get_content: bool = False,
+        probe: ProbeMethod | None = None,
+        stagger: float = 0,
+        timings: dict[str, float] | None = None,
+        samples: dict[str, RaceSample] | None = None,
     ) -> list[str] | list[bytes]:
-        total = len(urls)
-        results: list[bytes | None] = [None] * total
-        client = httpx.AsyncClient(timeout=total_seconds, follow_redirects=True)
-        await client.__aenter__()
-        async with anyio.create_task_group() as tg:
-            for i, url in enumerate(urls):
-                tg.start_soon(cls.fetch, client, url, results, i, get_content)
-            if not get_content:
-                threshold = 1 if return_first_completed else total - 1
-                for _ in range(math.ceil(total_seconds / wait_seconds)):
-                    await anyio.sleep(wait_seconds)
-                    if sum(r is not None for r in results) >= threshold:
-                        tg.cancel_scope.cancel()
-                        break
+        """Request urls concurrently
+
+        When `get_content` is False, stop as soon as enough requests succeed
+        (the first one if `return_first_completed` else all but one)
+        and cancel the others, or when `total_seconds` is reached.
+        `wait_seconds` is kept for backward compatibility and no longer used.
+
+        :param probe: if not None and `get_content` is False,
+            use lightweight request(see `HttpSniff.probe`) instead of full GET
+        :param stagger: if greater than 0 and `get_content` is False, start
+            requests one by one, the next one is started after this seconds
+            or once the previous one failed, and stop starting when finished
+        :param timings: if not None, probe seconds of responded urls will be put in
+        :param samples: if not None, probe samples of responded urls will be put in
+        """
+        if not (total := len(urls)):
+            return []
+        results: list[bytes | RaceSample | None] = [None] * total
+        threshold = max(1 if return_first_completed else total - 1, 1)
+        finished = anyio.Event()
+        pending = total
+
+        async def runner(url: str, index: int, done: anyio.Event) -> None:
+            nonlocal pending
+            try:
+                if probe is None or get_content:
+                    await cls.fetch(client, url, results, index, get_content)
+                else:
+                    await cls.probe(client, url, results, index, probe)
+            finally:
+                pending -= 1
+                done.set()
+            if not pending or sum(r is not None for r in results) >= threshold:
+                finished.set()
+
+        async with (
+            cls.client_provider.session(total_seconds) as client,
+            anyio.create_task_group() as tg,
+        ):
+            if get_content:
+                for i, url in enumerate(urls):
+                    tg.start_soon(runner, url, i, anyio.Event())
+            else:
+                with anyio.move_on_after(total_seconds):
+                    for i, url in enumerate(urls):
+                        tg.start_soon(runner, url, i, done := anyio.Event())
+                        if stagger > 0:
+                            with anyio.move_on_after(stagger):
+                                await done.wait()
+                            if finished.is_set():
+                                break
+                    await finished.wait()
+                tg.cancel_scope.cancel()
         if get_content:
-            return [i or b"" for i in results]
+            return [i if isinstance(i, bytes) else b"" for i in results]
+        probed = {
+            url: res
+            for url, res in zip(urls, results, strict=False)
+            if isinstance(res, RaceSample)
+        }
+        if timings is not None:
+            timings.update((url, sample.ttfb) for url, sample in probed.items())
+        if samples is not None:
+            samples.update(probed)
         return [url for url, res in zip(urls, results, strict=False) if res is not None]
 
     @classmethod
@@ -237,9 +1103,10 @@ class HttpSniff:
         wait_seconds: float = 0.8,
         total_seconds: float = 3,
         return_first_completed: bool = False,
+        probe: ProbeMethod | None = None,
     ) -> list[str]:
         return await cls.bulk_fetch(
-            urls, wait_seconds, total_seconds, return_first_completed
+            urls, wait_seconds, total_seconds, return_first_completed, probe=probe
         )
 
 
@@ -248,7 +1115,19 @@ class CdnHostBuilder:
     swagger_ui_full_version = "5.29.1"
     swagger_files = {"css": "swagger-ui.css", "js": "swagger-ui-bundle.js"}
     redoc_file = "redoc.standalone.js"
-    default_cache_file = "~/.cache/fastapi-cdn-host/urls.txt"
+    default_cache_file = "~/.cache/fastapi-cdn-host/race.json"
+    throughput_probe_bytes = 256 * 1024
+    # Accept the first host that responds within this milliseconds
+    accept_ms: float | None = None
+    # Seconds that race result cached in disk keeps valid
+    cache_ttl: float = 7 * 24 * 3600
+    # Seconds after which cached result is still used, but raced again in background
+    cache_soft_ttl: float | None = 24 * 3600
+    # Seconds that a worker waits for another one to finish the race
+    cache_lock_timeout: float = 30
+    # In-process copy of cache files: {file: ((mtime_ns, size), store)}
+    _cache_memo: ClassVar[dict[Path, tuple[tuple[int, int], RaceCacheStore]]] = {}
+    _memo_lock: ClassVar[threading.Lock] = threading.Lock()
 
     def __init__(
         self,
@@ -256,11 +1135,23 @@ class CdnHostBuilder:
         docs_cdn_host: DocsCdnHostType | None = None,
         favicon_url: str | None = None,
         cache: bool | None = None,
+        per_asset: bool = False,
+        startup_budget_ms: int | None = None,
+        provisional: AssetUrl | None = None,
+        holder: AssetUrlHolder | None = None,
+        refresh_interval: float | None = None,
     ) -> None:
         self.app = app
         self.docs_cdn_host = docs_cdn_host
         self.favicon_url = favicon_url
         self._cache = cache
+        self.per_asset = per_asset
+        self.startup_budget_ms = startup_budget_ms
+        self.provisional = provisional
+        self.holder = holder if holder is not None else AssetUrlHolder()
+        self.refresh_interval = refresh_interval
+        self.scores: dict[str, float] = {}
+        self.revalidating: threading.Thread | None = None
 
     @staticmethod
     def run_async(
@@ -306,26 +1197,86 @@ class CdnHostBuilder:
                 if isinstance(cdn_host, Path):
                     static_builder.static_root = cdn_host
                 elif isinstance(cdn_host, list) and isinstance(cdn_host[0], tuple):
-                    return self._cache_wrap(self._soonify_sniff)(favicon, cdn_host)
+                    return self._race(favicon, cdn_host)
                 else:
                     return self._sooner(cdn_host, favicon)
             if urls := static_builder.find():
                 return urls
-        return self._cache_wrap(self._soonify_sniff)(favicon)
+        return self._race(favicon)
+
+    def _race(
+        self, favicon: str | None, cdn_host: list[CdnHostInfoType] | None = None
+    ) -> AssetUrl:
+        if self.refresh_interval and self.app is not None:
+            choices = cdn_host or tuple(CdnHostEnum)
+            CdnMonitor(
+                self.holder, choices, self.refresh_interval, per_asset=self.per_asset
+            ).install(self.app)
+        sniff = self._cache_wrap(self._soonify_sniff)
+        if self.startup_budget_ms is None:
+            self.holder.swap(urls := sniff(favicon, cdn_host))
+            return urls
+        holder = self.holder
+
+        def race_in_background() -> None:
+            try:
+                urls = sniff(favicon, cdn_host)
+            except Exception:
+                logger.exception("Failed to race cdn hosts in background")
+            else:
+                holder.swap(urls)
+            finally:
+                # Let the waiters(e.g.: CdnMonitor) go on even if the race failed
+                holder.ready.set()
+
+        threading.Thread(target=race_in_background, daemon=True).start()
+        wait_seconds = self.startup_budget_ms / 1000
+        if holder.ready.wait(wait_seconds) and (urls := holder.current) is not None:
+            return urls
+        if (urls := self.provisional) is not None:
+            if favicon is not None and urls.favicon is None:
+                urls = replace(urls, favicon=favicon)
+        elif (urls := self.load_expired_cache(favicon, cdn_host)) is None:
+            first = cdn_host[0] if cdn_host else next(iter(CdnHostEnum))
+            urls = self._sooner(first, favicon)
+        logger.info(f"Race not finished in {self.startup_budget_ms}ms, use {urls}")
+        holder.set_default(urls)
+        return holder.urls
 
     def _soonify_sniff(
-        self, favicon, cdn_host: list[CdnHostInfoType] | None = None
+        self, favicon: str | None, cdn_host: list[CdnHostInfoType] | None = None
     ) -> AssetUrl:
+        sniff = self.sniff_per_asset if self.per_asset else self.sniff_the_fastest
+        sniff = functools.partial(sniff, timings=self.scores)
         if cdn_host is None:
-            return self.run_async(self.sniff_the_fastest, favicon)
-        return self.run_async(self.sniff_the_fastest, favicon, cdn_host)
+            return self.run_async(sniff, favicon)
+        return self.run_async(sniff, favicon, cdn_host)
+
+    def load_expired_cache(
+        self, favicon: str | None, cdn_host: list[CdnHostInfoType] | None = None
+    ) -> AssetUrl | None:
+        """Last race result in cache file even if it expired,
+        which is a better guess than the first candidate before race finished
+        """
+        if not self._cache:
+            return None
+        already_cached, file = self.get_cache_file()
+        if not already_cached:
+            return None
+        fingerprint = self.cache_fingerprint(cdn_host, self.per_asset)
+        store = self.load_cache(file)
+        version = self.swagger_ui_full_version
+        if (record := store.get(fingerprint, version, allow_expired=True)) is None:
+            return None
+        return record.to_asset_url(favicon)
 
     @classmethod
     def get_cache_file(cls) -> tuple[bool, Path]:
         file = Path(os.path.expanduser(cls.default_cache_file))
         try:
             exists = file.exists()
-            file.read_bytes()  # Python3.14 only raise PermissionError when reading
+            if not cls.is_memoized(file):
+                file.read_bytes()  # Python3.14 only raise PermissionError when reading
         except PermissionError:
             tmp_dir = Path("/tmp")  # nosec:B108
             if sys.platform == "win32":
@@ -336,49 +1287,183 @@ class CdnHostBuilder:
             exists = False
         return exists, file
 
-    def _cache_wrap(self, func: Callable[P, AssetUrl]) -> Callable[P, AssetUrl]:
+    @classmethod
+    def cache_fingerprint(
+        cls,
+        choices: Iterable[CdnHostInfoType | CdnHostEnum] | None = None,
+        per_asset: bool = False,
+    ) -> str:
+        """Hash of race candidates and swagger-ui version"""
+        _, they = cls.build_race_data(
+            tuple(CdnHostEnum) if choices is None else choices
+        )
+        data = [they, cls.swagger_ui_version, cls.swagger_ui_full_version, per_asset]
+        return hashlib.sha256(json.dumps(data).encode()).hexdigest()[:16]
+
+    @classmethod
+    def is_memoized(cls, file: Path) -> bool:
+        """Whether file has been read in process and not changed since then"""
+        try:
+            stat = file.stat()
+        except OSError:
+            return False
+        with cls._memo_lock:
+            memo = cls._cache_memo.get(file)
+        return memo is not None and memo[0] == (stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def load_cache(cls, file: Path) -> RaceCacheStore:
+        """Read the cache store of file, memoized in process until the file changed"""
+        try:
+            stat = file.stat()
+        except OSError:
+            return RaceCacheStore()
+        mark = (stat.st_mtime_ns, stat.st_size)
+        with cls._memo_lock:
+            if (memo := cls._cache_memo.get(file)) is not None and memo[0] == mark:
+                return memo[1]
+        try:
+            store = RaceCacheStore.loads(file.read_text("utf8"))
+        except (OSError, ValueError, TypeError) as e:
+            logger.info(f"Ignore invalid cache file {file}: {e}")
+            store = RaceCacheStore()
+        with cls._memo_lock:
+            cls._cache_memo[file] = (mark, store)
+        return store
+
+    @classmethod
+    def save_cache(cls, file: Path, record: RaceCache) -> None:
+        if not (parent := file.parent).exists():
+            parent.mkdir(parents=True, exist_ok=True)
+            logger.info(f"{parent} created!")
+        store = RaceCacheStore(dict(cls.load_cache(file).entries))
+        store.put(record)
+        # Write to a temp file then rename, so readers never see a half-written one
+        tmp = file.with_name(f".{file.name}.{os.getpid()}.tmp")
+        size = tmp.write_text(store.dumps(), "utf8")
+        os.replace(tmp, file)
+        stat = file.stat()
+        with cls._memo_lock:
+            cls._cache_memo[file] = ((stat.st_mtime_ns, stat.st_size), store)
+        logger.info(f"Save urls to {file} with {size=}.")
+
+    @classmethod
+    def clear_cache_memo(cls) -> None:
+        """Forget the in-process copy of cache files, next read will hit the disk"""
+        with cls._memo_lock:
+            cls._cache_memo.clear()
+
+    def _cache_wrap(self, func: Callable[..., AssetUrl]) -> Callable[..., AssetUrl]:
         if not self._cache:
             return func
 
         @functools.wraps(func)
-        def wrapper(*args: P.args, **kw: P.kwargs) -> AssetUrl:
+        def wrapper(
+            favicon: str | None, cdn_host: list[CdnHostInfoType] | None = None
+        ) -> AssetUrl:
+            fingerprint = self.cache_fingerprint(cdn_host, self.per_asset)
+            version = self.swagger_ui_full_version
             already_cached, file = self.get_cache_file()
             if already_cached:
-                lines = file.read_text("utf8").splitlines()
-                if len(lines) == 3:
-                    css = js = redoc = ""
-                    for i in lines:
-                        if i.endswith("css"):
-                            css = i
-                        elif "swagger" in i:
-                            js = i
-                        else:
-                            redoc = i
-                    return AssetUrl(
-                        css=css, js=js, redoc=redoc, favicon=self.favicon_url
-                    )
-            urls = func(*args, **kw)
-            content = "\n".join([urls.css, urls.js, urls.redoc]).encode()
-            if not (parent := file.parent).exists():
-                parent.mkdir(parents=True, exist_ok=True)
-                logger.info(f"{parent} created!")
-            size = file.write_bytes(content)
-            logger.info(f"Save urls to {file} with {size=}.")
+                store = self.load_cache(file)
+                if (record := store.get(fingerprint, version)) is not None:
+                    if record.stale:
+                        self._revalidate(func, favicon, cdn_host, file, fingerprint)
+                    return record.to_asset_url(favicon)
+            lock = CacheFileLock(file, timeout=self.cache_lock_timeout)
+            try:
+                lock.acquire()
+            except (TimeoutError, OSError) as e:
+                logger.warning(f"Race without lock: {e}")
+            else:
+                # Another worker may have finished the race while we were waiting
+                store = self.load_cache(file)
+                if (record := store.get(fingerprint, version)) is not None:
+                    lock.release()
+                    return record.to_asset_url(favicon)
+            logger.info(f"No valid cache for {fingerprint} in {file}, race again.")
+            try:
+                urls = self._race_and_save(func, favicon, cdn_host, file, fingerprint)
+            finally:
+                lock.release()
             return urls
 
         return wrapper
 
+    def _race_and_save(
+        self,
+        func: Callable[..., AssetUrl],
+        favicon: str | None,
+        cdn_host: list[CdnHostInfoType] | None,
+        file: Path,
+        fingerprint: str,
+    ) -> AssetUrl:
+        urls = func(favicon, cdn_host)
+        record = RaceCache(
+            css=urls.css,
+            js=urls.js,
+            redoc=urls.redoc,
+            fingerprint=fingerprint,
+            swagger_ui_version=self.swagger_ui_full_version,
+            ttl=self.cache_ttl,
+            scores=dict(self.scores),
+            soft_ttl=self.cache_soft_ttl,
+        )
+        self.save_cache(file, record)
+        return urls
+
+    def _revalidate(
+        self,
+        func: Callable[..., AssetUrl],
+        favicon: str | None,
+        cdn_host: list[CdnHostInfoType] | None,
+        file: Path,
+        fingerprint: str,
+    ) -> None:
+        """Race again in background to refresh the stale cache for next startup"""
+
+        def refresh() -> None:
+            lock = CacheFileLock(file, timeout=0)
+            try:
+                lock.acquire()
+            except (TimeoutError, OSError):
+                return  # Another worker is refreshing it
+            try:
+                version = self.swagger_ui_full_version
+                record = self.load_cache(file).get(fingerprint, version)
+                if record is None or record.stale:
+                    self._race_and_save(func, favicon, cdn_host, file, fingerprint)
+            except Exception:
+                logger.exception(f"Failed to refresh stale cache in {file}")
+            finally:
+                lock.release()
+
+        logger.info(f"Cache for {fingerprint} in {file} is stale, race in background")
+        self.revalidating = threading.Thread(target=refresh, daemon=True)
+        self.revalidating.start()
+
     @staticmethod
+    @functools.lru_cache(maxsize=64)
     def fill_root_path(urls: AssetUrl, root: str) -> AssetUrl:
-        if root:
-            for attr in ("js", "css", "redoc", "favicon"):
-                if (
-                    (v := getattr(urls, attr))
-                    and v.startswith("/")
-                    and not v.startswith(root)
-                ):
-                    setattr(urls, attr, root + v)
-        return urls
+        """Prefix root path to local urls, memoized for each (urls, root) pair
+
+        Usage::
+            >>> urls = AssetUrl(css='/static/a.css', js='https://a.com/a.js', redoc='')
+            >>> CdnHostBuilder.fill_root_path(urls, '/api').css
+            '/api/static/a.css'
+            >>> CdnHostBuilder.fill_root_path(urls, '').css
+            '/static/a.css'
+        """
+        if not root:
+            return urls
+        changes = {
+            attr: root + v
+            for attr in ("js", "css", "redoc", "favicon")
+            if (v := getattr(urls, attr))
+            and v.startswith("/")
+            and not v.startswith(root)
+        }
+        return replace(urls, **changes) if changes else urls
 
     @classmethod
     def build_swagger_path(cls, asset_path: str | tuple[str, str]) -> str:
@@ -414,11 +1499,113 @@ class CdnHostBuilder:
         cls,
         favicon_url: str | None = None,
         choices: Iterable[CdnHostInfoType | CdnHostEnum] = tuple(CdnHostEnum),
+        accept_ms: float | None = None,
+        timings: dict[str, float] | None = None,
     ) -> AssetUrl:
+        """Race choices and build asset urls by the fastest one
+
+        :param accept_ms: try choices in order and accept the first one that
+            responds within this milliseconds, default to `cls.accept_ms`
+        :param timings: if not None, probe seconds of responded urls will be put in
+        """
+        if accept_ms is None:
+            accept_ms = cls.accept_ms
         css_urls, they = cls.build_race_data(choices)
-        fast_css_url = await HttpSniff.find_fastest_host(css_urls)
+        fast_css_url = await HttpSniff.find_fastest_host(
+            css_urls, accept_ms=accept_ms, timings=timings
+        )
+        return cls._build_winner(fast_css_url, css_urls, they, favicon_url)
+
+    @classmethod
+    async def race_the_fastest(
+        cls,
+        favicon_url: str | None = None,
+        choices: Iterable[CdnHostInfoType | CdnHostEnum] = tuple(CdnHostEnum),
+        samples: int = 3,
+        score: RaceScore = "p50",
+        total_seconds: float = 5,
+    ) -> tuple[AssetUrl, RaceReport]:
+        """Same as `sniff_the_fastest` but take several samples for each host,
+        and return the race report together with asset urls"""
+        css_urls, they = cls.build_race_data(choices)
+        report = await HttpSniff.race(
+            css_urls, samples, total_seconds=total_seconds, score=score
+        )
+        fast_css_url = report.chosen or css_urls[0]
+        urls = cls._build_winner(fast_css_url, css_urls, they, favicon_url)
+        return urls, report
+
+    @classmethod
+    async def race_per_asset(
+        cls,
+        favicon_url: str | None = None,
+        choices: Iterable[CdnHostInfoType | CdnHostEnum] = tuple(CdnHostEnum),
+        total_seconds: float = 5,
+    ) -> tuple[AssetUrl, dict[str, RaceReport]]:
+        """Choose css/js/redoc cdn host independently
+
+        The swagger-ui.css is small, so it is scored by time-to-first-byte,
+        while the large js bundles are scored by bytes per second.
+        """
+        _, they = cls.build_race_data(choices)
+        candidates = [cls.build_asset_url(host, path) for host, path in they]
+        reports: dict[str, RaceReport] = {}
+
+        async def race(attr: str) -> None:
+            # Different cdn hosts may share the same official redoc url
+            urls = list(dict.fromkeys(getattr(i, attr) for i in candidates))
+            if attr == "css":
+                report = await HttpSniff.race(urls, 1, total_seconds)
+            else:
+                report = await HttpSniff.race(
+                    urls,
+                    1,
+                    total_seconds,
+                    score="throughput",
+                    probe_bytes=cls.throughput_probe_bytes,
+                )
+            if report.chosen is None:
+                report.chosen = urls[0]
+            reports[attr] = report
+
+        async with (
+            HttpSniff.client_provider.session(total_seconds),
+            anyio.create_task_group() as tg,
+        ):
+            for attr in ("css", "js", "redoc"):
+                tg.start_soon(race, attr)
+        asset_urls = AssetUrl(
+            css=cast(str, reports["css"].chosen),
+            js=cast(str, reports["js"].chosen),
+            redoc=cast(str, reports["redoc"].chosen),
+            favicon=favicon_url,
+        )
+        logger.info(f"Select cdn for each asset: {asset_urls}")
+        return asset_urls, reports
+
+    @classmethod
+    async def sniff_per_asset(
+        cls,
+        favicon_url: str | None = None,
+        choices: Iterable[CdnHostInfoType | CdnHostEnum] = tuple(CdnHostEnum),
+        timings: dict[str, float] | None = None,
+    ) -> AssetUrl:
+        urls, reports = await cls.race_per_asset(favicon_url, choices)
+        if timings is not None:
+            for report in reports.values():
+                timings.update((h.url, h.p50) for h in report.hosts if h.samples)
+        return urls
+
+    @classmethod
+    def _build_winner(
+        cls,
+        fast_css_url: str,
+        css_urls: list[str],
+        they: list[StrictCdnHostInfoType],
+        favicon_url: str | None = None,
+    ) -> AssetUrl:
         fast_host, fast_asset_path = they[css_urls.index(fast_css_url)]
-        logger.info(f"Select cdn: {fast_host[0]} to serve swagger css/js")
+        logger.info(f"Select cdn: {fast_host} to serve swagger css/js")
         return cls.build_asset_url(
             fast_host, fast_asset_path, fast_css_url, favicon_url
         )
@@ -460,31 +1647,820 @@ class CdnHostBuilder:
         return favicon_url
 
 
+class CdnMonitor:
+    """Re-race cdn hosts periodically during app lifespan, and swap in the new
+    winner when current host is down or keeps being much slower than it
+
+    :param holder: the AssetUrlHolder that used by docs handlers
+    :param choices: candidate cdn hosts
+    :param interval: seconds between two checks
+    :param max_failures: failover after current host failed this times in a row
+    :param hysteresis: only switch to a host that is faster than this ratio
+    :param patience: only switch after the faster host won this times in a row
+    :param max_interval: upper bound of backoff when all hosts are unreachable
+    :param per_asset: whether re-race and swap css/js/redoc host independently
+    """
+
+    # Lower is better, the same scores as `CdnHostBuilder.race_per_asset`
+    scorers: ClassVar[dict[str, Callable[[HostStats], float]]] = {
+        "css": operator.attrgetter("p50"),
+        "js": lambda h: 1 / h.throughput if h.throughput else math.inf,
+        "redoc": lambda h: 1 / h.throughput if h.throughput else math.inf,
+    }
+
+    def __init__(
+        self,
+        holder: AssetUrlHolder,
+        choices: Iterable[CdnHostInfoType | CdnHostEnum] = tuple(CdnHostEnum),
+        interval: float = 600,
+        samples: int = 3,
+        max_failures: int = 2,
+        hysteresis: float = 0.3,
+        patience: int = 3,
+        max_interval: float = 3600,
+        timeout: float = 5,
+        per_asset: bool = False,
+    ) -> None:
+        self.holder = holder
+        self.css_urls, self.they = CdnHostBuilder.build_race_data(choices)
+        self.per_asset = per_asset
+        self.interval = interval
+        self.samples = samples
+        self.max_failures = max_failures
+        self.hysteresis = hysteresis
+        self.patience = patience
+        self.max_interval = max(max_interval, interval)
+        self.timeout = timeout
+        self.failures_of = dict.fromkeys(self.scorers, 0)
+        self.streak_of = dict.fromkeys(self.scorers, 0)
+        self.last_report: RaceReport | None = None
+
+    @property
+    def failures(self) -> int:
+        return self.failures_of["css"]
+
+    @property
+    def streak(self) -> int:
+        return self.streak_of["css"]
+
+    def install(self, app: FastAPI) -> None:
+        """Run `self.loop` in background during lifespan of app"""
+        origin = app.router.lifespan_context
+
+        @contextlib.asynccontextmanager
+        async def lifespan(application: Any) -> AsyncGenerator[Any, None]:
+            async with origin(application) as state, anyio.create_task_group() as tg:
+                tg.start_soon(self.loop)
+                yield state
+                tg.cancel_scope.cancel()
+
+        app.router.lifespan_context = lifespan
+
+    async def loop(self) -> None:
+        delay = self.interval
+        while True:
+            await anyio.sleep(delay)
+            try:
+                healthy = await self.check()
+            except Exception:
+                logger.exception("Failed to check cdn hosts")
+                healthy = False
+            # Backoff when network is unavailable
+            delay = self.interval if healthy else min(delay * 2, self.max_interval)
+
+    async def check(self) -> bool:
+        """Race once and swap asset urls if needed
+
+        :return: False if all the cdn hosts failed
+        """
+        if not self.holder.ready.is_set():
+            return True  # Initial race not finished yet
+        if self.per_asset:
+            return await self.check_per_asset()
+        current = self.holder.urls
+        report = await HttpSniff.race(self.css_urls, self.samples, self.timeout)
+        self.last_report = report
+        if (winner := self.decide("css", report, current.css)) is not None:
+            urls = CdnHostBuilder._build_winner(
+                winner, self.css_urls, self.they, current.favicon
+            )
+            self.holder.swap(urls)
+        return report.chosen is not None
+
+    async def check_per_asset(self) -> bool:
+        current = self.holder.urls
+        candidates = [CdnHostBuilder.build_asset_url(h, p) for h, p in self.they]
+        reports: dict[str, RaceReport] = {}
+
+        async def race(attr: str) -> None:
+            urls = list(dict.fromkeys(getattr(i, attr) for i in candidates))
+            if attr == "css":
+                report = await HttpSniff.race(urls, self.samples, self.timeout)
+            else:
+                report = await HttpSniff.race(
+                    urls,
+                    self.samples,
+                    self.timeout,
+                    score="throughput",
+                    probe_bytes=CdnHostBuilder.throughput_probe_bytes,
+                )
+            reports[attr] = report
+
+        async with (
+            HttpSniff.client_provider.session(self.timeout),
+            anyio.create_task_group() as tg,
+        ):
+            for attr in self.scorers:
+                tg.start_soon(race, attr)
+        self.last_report = reports["css"]
+        changes = {
+            attr: winner
+            for attr, report in reports.items()
+            if (winner := self.decide(attr, report, getattr(current, attr)))
+        }
+        if changes:
+            self.holder.swap(replace(current, **changes))
+        return any(report.chosen is not None for report in reports.values())
+
+    def decide(self, attr: str, report: RaceReport, current: str) -> str | None:
+        """Return url of the race winner if asset should switch to it"""
+        if (winner := report.chosen) is None:
+            return None
+        try:
+            current_stats: HostStats | None = report[current]
+        except KeyError:
+            current_stats = None
+        if current_stats is not None and current_stats.samples:
+            self.failures_of[attr] = 0
+        else:
+            self.failures_of[attr] += 1
+        if winner == current:
+            self.streak_of[attr] = 0
+            return None
+        scorer = self.scorers[attr]
+        if self.failures_of[attr] >= self.max_failures:
+            logger.warning(f"Cdn host of {current} is down, failover to {winner}")
+        elif current_stats is not None and (
+            scorer(report[winner]) < scorer(current_stats) * (1 - self.hysteresis)
+        ):
+            self.streak_of[attr] += 1
+            if self.streak_of[attr] < self.patience:
+                return None
+            logger.info(f"Switch cdn host to {winner} as it is much faster")
+        else:
+            self.streak_of[attr] = 0
+            return None
+        self.failures_of[attr] = self.streak_of[attr] = 0
+        return winner
+
+
+def dump_json(data: Any) -> bytes:
+    """Serialize data to compact json, by orjson if it is installed"""
+    try:
+        import orjson
+    except ImportError:
+        text = json.dumps(
+            data, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        )
+        return text.encode()
+    return orjson.dumps(data)
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    """Gzip and brotli(if installed) variants of body
+
+    Usage::
+        >>> import gzip
+        >>> gzip.decompress(compress(b'a' * 100)['gzip'])[:3]
+        b'aaa'
+    """
+    encodings = {"gzip": gzip.compress(body, mtime=0)}
+    try:
+        import brotli  # ty:ignore[unresolved-import]
+    except ImportError:
+        pass
+    else:
+        encodings["br"] = brotli.compress(body)
+    return encodings
+
+
+class OpenapiSplitter:
+    """Split openapi schema into sub-specs by tag, so that swagger-ui need not
+    parse and render the whole giant spec at once
+
+    Usage::
+        >>> schema = {'openapi': '3.1.0', 'paths': {
+        ...     '/a': {'get': {'tags': ['A'], 'responses': {}}},
+        ...     '/b': {'get': {'responses': {}}},
+        ... }}
+        >>> OpenapiSplitter.tags(schema), OpenapiSplitter.count_operations(schema)
+        (['A', 'default'], 2)
+        >>> list(OpenapiSplitter.sub_spec(schema, 'A')['paths'])
+        ['/a']
+    """
+
+    DEFAULT_TAG = "default"
+    METHODS = frozenset(
+        ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+    )
+
+    @classmethod
+    def _operations(cls, schema: dict[str, Any]) -> Iterable[tuple[str, str, dict]]:
+        for path, item in (schema.get("paths") or {}).items():
+            for method, op in item.items():
+                if method in cls.METHODS and isinstance(op, dict):
+                    yield path, method, op
+
+    @classmethod
+    def count_operations(cls, schema: dict[str, Any]) -> int:
+        return sum(1 for _ in cls._operations(schema))
+
+    @classmethod
+    def tags(cls, schema: dict[str, Any]) -> list[str]:
+        """Tags that have operations, ordered as the 'tags' field then appearance"""
+        used: dict[str, None] = {}
+        for *_, op in cls._operations(schema):
+            for tag in op.get("tags") or [cls.DEFAULT_TAG]:
+                used[tag] = None
+        declared = [t["name"] for t in schema.get("tags") or [] if t["name"] in used]
+        return list(dict.fromkeys([*declared, *used]))
+
+    @staticmethod
+    def _refs(data: Any) -> Iterable[str]:
+        stack = [data]
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, dict):
+                if isinstance(ref := obj.get("$ref"), str):
+                    yield ref
+                stack.extend(obj.values())
+            elif isinstance(obj, list):
+                stack.extend(obj)
+
+    @classmethod
+    def sub_spec(cls, schema: dict[str, Any], tag: str) -> dict[str, Any]:
+        """Spec that only contains operations of tag and components they used"""
+        paths: dict[str, dict[str, Any]] = {}
+        for path, method, op in cls._operations(schema):
+            if tag in (op.get("tags") or [cls.DEFAULT_TAG]):
+                if path not in paths:
+                    item = schema["paths"][path]
+                    paths[path] = {
+                        k: v for k, v in item.items() if k not in cls.METHODS
+                    }
+                paths[path][method] = op
+        spec = {k: v for k, v in schema.items() if k not in ("paths", "components")}
+        spec["paths"] = paths
+        if "tags" in schema:
+            spec["tags"] = [t for t in schema["tags"] if t.get("name") == tag]
+        if components := schema.get("components"):
+            used: dict[str, dict[str, Any]] = {}
+            if "securitySchemes" in components:  # Referenced by name, not $ref
+                used["securitySchemes"] = components["securitySchemes"]
+            pending = list(cls._refs(paths))
+            while pending:
+                parts = pending.pop().split("/")
+                if len(parts) != 4 or parts[:2] != ["#", "components"]:
+                    continue
+                section, name = parts[2], parts[3]
+                if name in used.get(section, {}) or name not in (
+                    found := components.get(section, {})
+                ):
+                    continue
+                used.setdefault(section, {})[name] = found[name]
+                pending.extend(cls._refs(found[name]))
+            spec["components"] = used
+        return spec
+
+    @staticmethod
+    def tag_url(openapi_url: str, tag: str) -> str:
+        """Url of sub-spec, e.g.: '/openapi.json?a=1' -> '/openapi/items.json?a=1'
+
+        Usage::
+            >>> OpenapiSplitter.tag_url('/api/openapi.json?a=1', 'my items')
+            '/api/openapi/my%20items.json?a=1'
+        """
+        base, sep, query = openapi_url.partition("?")
+        return f"{base.removesuffix('.json')}/{quote(tag, safe='')}.json{sep}{query}"
+
+
+@dataclass(frozen=True)
+class RenderedPage:
+    """Encoded docs page or openapi document, with a strong ETag of its content"""
+
+    body: bytes
+    etag: str
+    modified_at: float = field(default_factory=lambda: float(int(time.time())))
+    links: Annotated[tuple[str, ...], "Values of the Link header"] = ()
+    media_type: str = "text/html"
+    encodings: Annotated[dict[str, bytes], "Compressed variants of body"] = field(
+        default_factory=dict
+    )
+
+    # Body smaller than this is not worth to compress
+    COMPRESS_MIN_SIZE: ClassVar[int] = 1024
+
+    @classmethod
+    def from_response(
+        cls, response: Response, links: Iterable[str] = (), compressed: bool = False
+    ) -> RenderedPage:
+        body = bytes(response.body)
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        return cls(
+            body,
+            etag,
+            links=tuple(links),
+            media_type=response.media_type or cls.media_type,
+            encodings=(
+                compress(body)
+                if compressed and len(body) >= cls.COMPRESS_MIN_SIZE
+                else {}
+            ),
+        )
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.modified_at, usegmt=True)
+
+    def choose_encoding(self, accept_encoding: str) -> str | None:
+        """Best encoding of body that accepted by client, None means identity
+
+        Usage::
+            >>> page = RenderedPage(b'', '"a"', encodings={'gzip': b'', 'br': b''})
+            >>> page.choose_encoding('gzip, deflate, br')
+            'br'
+            >>> page.choose_encoding('br;q=0, gzip;q=0.5'), page.choose_encoding('')
+            ('gzip', None)
+        """
+        accepted: dict[str, float] = {}
+        for item in accept_encoding.lower().split(","):
+            name, _, params = item.strip().partition(";")
+            q = 1.0
+            if (param := params.strip()).startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0
+            accepted[name.strip()] = q
+        candidates = [
+            (accepted.get(i, accepted.get("*", 0)), -index, i)
+            for index, i in enumerate(("br", "gzip"))
+            if i in self.encodings
+        ]
+        if candidates and (best := max(candidates))[0] > 0:
+            return best[2]
+        return None
+
+    def is_fresh(self, headers: Mapping[str, str], etag: str | None = None) -> bool:
+        """Whether the copy of client is still valid, according to RFC 9110 13.2.2
+
+        Usage::
+            >>> page = RenderedPage(b'', '"abc"', modified_at=0)
+            >>> page.is_fresh({'if-none-match': 'W/"abc", "xyz"'})
+            True
+            >>> page.is_fresh({'if-modified-since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+            True
+            >>> page.is_fresh({})
+            False
+        """
+        if etag is None:
+            etag = self.etag
+        if (tags := headers.get("if-none-match")) is not None:
+            return any(
+                tag == "*" or tag.removeprefix("W/") == etag
+                for tag in (i.strip() for i in tags.split(","))
+            )
+        if since := headers.get("if-modified-since"):
+            try:
+                return parsedate_to_datetime(since).timestamp() >= self.modified_at
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def to_response(
+        self, request: Request | None = None, cache_control: str | None = None
+    ) -> Response:
+        """Full response, or 304 Not Modified if the request has a fresh copy"""
+        body, etag = self.body, self.etag
+        headers = {"Last-Modified": self.last_modified}
+        if self.encodings:
+            headers["Vary"] = "Accept-Encoding"
+            accept = request.headers.get("accept-encoding", "") if request else ""
+            if (encoding := self.choose_encoding(accept)) is not None:
+                body, etag = self.encodings[encoding], f'{etag[:-1]}-{encoding}"'
+                headers["Content-Encoding"] = encoding
+        headers["ETag"] = etag
+        if self.links:
+            headers["Link"] = ", ".join(self.links)
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        if request is not None and self.is_fresh(request.headers, etag):
+            headers.pop("Content-Encoding", None)
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+def is_async_callable(obj: Any) -> bool:
+    """Whether calling obj returns a coroutine, including partial wrappers
+    and instances with async `__call__`
+
+    Usage::
+        >>> class Lock:
+        ...     async def __call__(self, request): ...
+        >>> is_async_callable(functools.partial(Lock())), is_async_callable(print)
+        (True, False)
+    """
+    while isinstance(obj, functools.partial):
+        obj = obj.func
+    return inspect.iscoroutinefunction(obj) or (
+        callable(obj) and inspect.iscoroutinefunction(type(obj).__call__)
+    )
+
+
+def is_builtin_lock(obj: Any) -> bool:
+    """Whether obj is one of the non-blocking locks of `fastapi_cdn_host.utils`,
+    subclasses are excluded as they may override `validate` to do blocking IO"""
+    while isinstance(obj, functools.partial):
+        obj = obj.func
+    if type(obj) in (ParamLock, WeekdayLock, TodayLock):
+        return True
+    return obj is weekday_lock or obj is today_lock
+
+
+class CompiledLock:
+    """Lock of docs that classified once, with optional cache of passed verdicts
+
+    :param lock: function that receive a request argument to verify it
+    :param cache_ttl: if not None, a client that passed the lock will not be
+        checked again in this seconds, while it sends the same credential
+    :param cache_key: function that receive a request and return its credential,
+        default to `verdict_key`(client host, query string, Authorization and
+        Cookie headers). Warning: the default one is only safe for locks that
+        read nothing but these, e.g. with a lock that checks `X-Api-Key`, one
+        authorized user unlocks docs for every client behind the same NAT.
+    :param threads: max number of sync lock calls that run in worker threads
+        at the same time, None to call sync lock inline in the event loop
+    :param timeout: if not None, respond 503 when the lock cost more seconds,
+        the timed out thread keeps its slot of `threads` until it finished
+    """
+
+    max_verdicts = 1024
+    # Renamed from `cancellable` since anyio 4.1
+    abandon_kwarg: ClassVar[str] = (
+        "abandon_on_cancel"
+        if "abandon_on_cancel" in inspect.signature(to_thread.run_sync).parameters
+        else "cancellable"
+    )
+
+    def __init__(
+        self,
+        lock: LockFunc,
+        cache_ttl: float | None = None,
+        threads: int | None = 8,
+        timeout: float | None = None,
+        cache_key: Callable[[Request], str] | None = None,
+    ) -> None:
+        self.lock = lock
+        self.is_async = is_async_callable(lock)
+        self.in_thread = bool(threads) and not self.is_async
+        if self.in_thread and is_builtin_lock(lock):
+            # Thread switching costs more than checking a query param
+            self.in_thread = False
+        self.threads = threads
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.cache_key = cache_key or self.verdict_key
+        self._verdicts: OrderedDict[str, float] = OrderedDict()
+        self._verdicts_lock = threading.Lock()
+        # CapacityLimiter is bound to event loop, so keep one for each run
+        self._limiter: RunVar[anyio.CapacityLimiter] = RunVar("docs_lock_limiter")
+
+    @classmethod
+    def build(
+        cls,
+        lock: LockFunc | CompiledLock | None,
+        cache_ttl: float | None = None,
+        threads: int | None = 8,
+        timeout: float | None = None,
+        cache_key: Callable[[Request], str] | None = None,
+    ) -> CompiledLock | None:
+        if lock is None or isinstance(lock, CompiledLock):
+            return lock
+        return cls(lock, cache_ttl, threads, timeout, cache_key)
+
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        try:
+            return self._limiter.get()
+        except LookupError:
+            limiter = anyio.CapacityLimiter(self.threads or 1)
+            self._limiter.set(limiter)
+            return limiter
+
+    @staticmethod
+    def verdict_key(req: Request) -> str:
+        client = getattr(req.client, "host", "")
+        headers = req.headers
+        credential = [
+            client,
+            req.url.query,
+            headers.get("authorization", ""),
+            headers.get("cookie", ""),
+        ]
+        return hashlib.sha256("\n".join(credential).encode()).hexdigest()
+
+    def passed_recently(self, key: str) -> bool:
+        with self._verdicts_lock:
+            if (expire := self._verdicts.get(key)) is None:
+                return False
+            if expire < time.monotonic():
+                del self._verdicts[key]
+                return False
+            return True
+
+    def remember(self, key: str) -> None:
+        assert self.cache_ttl is not None  # nosec:B101
+        with self._verdicts_lock:
+            self._verdicts[key] = time.monotonic() + self.cache_ttl
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.max_verdicts:
+                self._verdicts.popitem(last=False)
+
+    async def check(self, req: Request) -> None:
+        try:
+            with anyio.fail_after(self.timeout):
+                await self.run_lock(req)
+        except TimeoutError as e:
+            raise HTTPException(status_code=503, detail="Docs lock timeout") from e
+
+    async def run_lock(self, req: Request) -> None:
+        if self.is_async:
+            await self.lock(req)
+            return
+        if self.in_thread:
+            result = await self.run_in_thread(req)
+        else:
+            result = self.lock(req)
+        if inspect.isawaitable(result):
+            await result
+
+    async def run_in_thread(self, req: Request) -> Any:
+        """Call sync lock in worker thread. Unlike the `limiter` argument of
+        `to_thread.run_sync`, the token is held until the thread finished,
+        even if it was abandoned by timeout"""
+        limiter, borrower = self.limiter, object()
+        await limiter.acquire_on_behalf_of(borrower)
+        guard = threading.Lock()
+        owner: list[str] = []  # Who should release the token: 'thread' or 'loop'
+
+        def claim(who: str) -> bool:
+            with guard:
+                if not owner:
+                    owner.append(who)
+                return owner[0] == who
+
+        def run() -> Any:
+            if not claim("thread"):
+                return None  # Cancelled before started
+            try:
+                return self.lock(req)
+            finally:
+                with contextlib.suppress(RuntimeError):  # Event loop closed
+                    from_thread.run_sync(limiter.release_on_behalf_of, borrower)
+
+        try:
+            if self.abandon_kwarg == "abandon_on_cancel":
+                return await to_thread.run_sync(run, abandon_on_cancel=True)
+            return await to_thread.run_sync(run, cancellable=True)  # anyio<4.1
+        except BaseException:
+            if claim("loop"):
+                limiter.release_on_behalf_of(borrower)
+            raise
+
+    async def __call__(self, req: Request) -> None:
+        if self.cache_ttl is None:
+            await self.check(req)
+            return
+        key = self.cache_key(req)
+        if self.passed_recently(key):
+            return
+        await self.check(req)  # Raise HTTPException if not passed
+        self.remember(key)
+
+
 class DocsBuilder:
-    def __init__(self, index: int) -> None:
+    # Max number of distinct (root_path, asset urls) pages kept for each route
+    max_rendered_pages = 32
+    # Apply `large_spec_parameters` to swagger-ui if operations more than this
+    large_spec_operations = 500
+    large_spec_parameters: ClassVar[dict[str, Any]] = {
+        "docExpansion": "none",
+        "defaultModelsExpandDepth": -1,
+    }
+
+    def __init__(
+        self,
+        index: int,
+        cache_control: str | None = None,
+        resource_hints: bool = True,
+        early_hints: bool = False,
+        openapi_query: bool = False,
+        split_by_tag: bool = False,
+    ) -> None:
         self.index = index
+        self.split_by_tag = split_by_tag
+        self.cache_control = cache_control
+        self.resource_hints = resource_hints
+        self.early_hints = early_hints
+        # Pass query params of docs page to openapi url, so that lock can pass
+        self.openapi_query = openapi_query
+        self._pages: OrderedDict[Hashable, RenderedPage] = OrderedDict()
+        self._pages_lock = threading.Lock()
+        # (schema, its tags), to avoid walking through the same schema again
+        self._spec_tags: tuple[dict[str, Any], list[str]] | None = None
 
     @staticmethod
-    async def try_request_lock(req: Request, lock: LockFunc | None = None) -> None:
-        if lock is not None:
-            if inspect.iscoroutinefunction(lock):
-                await lock(req)
-            else:
-                lock(req)
+    async def try_request_lock(
+        req: Request, lock: LockFunc | CompiledLock | None = None
+    ) -> None:
+        if (compiled := CompiledLock.build(lock)) is not None:
+            await compiled(req)
 
     def update_entrypoint(
         self, func: Callable[..., Any], app: FastAPI, url: str
     ) -> None:
         app.routes[self.index] = APIRoute(url, func, include_in_schema=False)
 
+    @staticmethod
+    def to_holder(urls: AssetUrl | AssetUrlHolder) -> AssetUrlHolder:
+        return urls if isinstance(urls, AssetUrlHolder) else AssetUrlHolder(urls)
+
+    def get_cache_control(self, lock: LockFunc | None = None) -> str:
+        """Let browsers revalidate on every visit (cheap with ETag),
+        and keep locked pages out of shared caches"""
+        if self.cache_control is not None:
+            return self.cache_control
+        return "private, no-cache" if lock is not None else "no-cache"
+
+    @staticmethod
+    def get_openapi_schema(app: FastAPI, root_path: str) -> dict[str, Any]:
+        schema = app.openapi()
+        # Same as the openapi route of FastAPI
+        if root_path and getattr(app, "root_path_in_servers", True):
+            server_urls = {s.get("url") for s in schema.get("servers", [])}
+            if root_path not in server_urls:
+                schema = dict(schema)
+                schema["servers"] = [{"url": root_path}] + schema.get("servers", [])
+        return schema
+
+    def get_swagger_ui_parameters(
+        self, app: FastAPI, openapi_url: str
+    ) -> tuple[str, dict[str, Any], list[dict[str, str]]]:
+        """Spec url for swagger-ui to load first, its parameters (with large spec
+        presets if needed), and per-tag spec urls for the spec selector
+
+        The per-tag urls are not passed to swagger-ui as `urls`, because it does
+        not load `url` when `urls` is set, and leaves that to the top bar of
+        StandaloneLayout, which the page of FastAPI does not render.
+        """
+        parameters = dict(getattr(app, "swagger_ui_parameters", None) or {})
+        if self.count_route_operations(app) > self.large_spec_operations:
+            parameters = {**self.large_spec_parameters, **parameters}
+        spec_urls: list[dict[str, str]] = []
+        if self.split_by_tag and (tags := self.try_get_spec_tags(app)):
+            spec_urls = [
+                {"url": OpenapiSplitter.tag_url(openapi_url, tag), "name": tag}
+                for tag in tags
+            ]
+            spec_urls.append({"url": openapi_url, "name": "All"})
+            openapi_url = spec_urls[0]["url"]
+        return openapi_url, parameters, spec_urls
+
+    @staticmethod
+    def count_route_operations(app: FastAPI) -> int:
+        """Number of operations in openapi schema, counted from routes,
+        so that the schema need not be generated to render docs page"""
+        return sum(
+            len(route.methods or ())
+            for route in app.routes
+            if isinstance(route, APIRoute) and route.include_in_schema
+        )
+
+    def get_spec_tags(self, app: FastAPI) -> list[str]:
+        """Tags of openapi schema, memoized until the schema regenerated"""
+        schema = app.openapi()
+        if (memo := self._spec_tags) is None or memo[0] is not schema:
+            memo = self._spec_tags = (schema, OpenapiSplitter.tags(schema))
+        return memo[1]
+
+    def try_get_spec_tags(self, app: FastAPI) -> list[str]:
+        """Let docs page be rendered without the selector if schema is broken"""
+        try:
+            return self.get_spec_tags(app)
+        except Exception:
+            logger.exception("Failed to generate openapi schema to split by tag")
+            return []
+
+    @staticmethod
+    def add_spec_selector(html: str, spec_urls: list[dict[str, str]]) -> str:
+        """Swagger-ui's own `urls` selector lives in the top bar of
+        StandaloneLayout, which swagger-ui-bundle.js does not include,
+        so add a select element that switch the spec of swagger-ui"""
+        options = "".join(
+            f'<option value="{escape(i["url"])}">{escape(i["name"])}</option>'
+            for i in spec_urls
+        )
+        selector = (
+            '<div style="padding:10px 20px"><select id="spec-selector" onchange="'
+            'ui.specActions.updateUrl(this.value);ui.specActions.download(this.value)"'
+            f">{options}</select></div>"
+        )
+        return html.replace(
+            '<div id="swagger-ui">', selector + '<div id="swagger-ui">', 1
+        )
+
+    def get_openapi_url(self, app: FastAPI, req: Request, root_path: str) -> str:
+        openapi_url = root_path + getattr(app, "openapi_url", "")
+        # Re-encode the parsed params instead of using the raw query string,
+        # which is embedded into the js/html of docs pages
+        if self.openapi_query and (query := urlencode(req.query_params.multi_items())):
+            openapi_url += "?" + query
+        return openapi_url
+
+    @staticmethod
+    def build_links(
+        urls: Iterable[tuple[str, Literal["style", "script", "fetch"]]],
+    ) -> list[str]:
+        """Preconnect to cdn origins and preload assets, so that browsers can
+        fetch them before the html parsed
+
+        Usage::
+            >>> DocsBuilder.build_links([('https://a.com/x/a.css', 'style'), ('/openapi.json', 'fetch')])
+            ['<https://a.com>; rel=preconnect', '<https://a.com/x/a.css>; rel=preload; as=style', '</openapi.json>; rel=preload; as=fetch; crossorigin']
+        """
+        preconnect: list[str] = []
+        preload: list[str] = []
+        for url, kind in urls:
+            if "://" in url:
+                scheme, rest = url.split("://", 1)
+                origin = f"<{scheme}://{rest.split('/', 1)[0]}>; rel=preconnect"
+                if origin not in preconnect:
+                    preconnect.append(origin)
+            link = f"<{url}>; rel=preload; as={kind}"
+            if kind == "fetch":  # Must match the cors mode of fetch()
+                link += "; crossorigin"
+            preload.append(link)
+        return preconnect + preload
+
+    @staticmethod
+    async def send_early_hints(req: Request, links: Iterable[str]) -> None:
+        """Send 103 Early Hints if the ASGI server supports it"""
+        if "http.response.early_hint" not in req.scope.get("extensions", {}):
+            return
+        # Starlette exposes no public api to send extra messages from endpoint
+        send = req._send
+        await send(
+            {
+                "type": "http.response.early_hint",
+                "links": [i.encode("latin-1") for i in links],
+            }
+        )
+
+    async def respond(
+        self, req: Request, page: RenderedPage, lock: LockFunc | None = None
+    ) -> Response:
+        if self.early_hints and page.links and not page.is_fresh(req.headers):
+            await self.send_early_hints(req, page.links)
+        return page.to_response(req, self.get_cache_control(lock))
+
+    def render_once(
+        self, key: Hashable, build: Callable[[], RenderedPage]
+    ) -> RenderedPage:
+        """Render page for each distinct key(root_path, asset urls...) only once"""
+        with self._pages_lock:
+            if (page := self._pages.get(key)) is not None:
+                self._pages.move_to_end(key)
+                return page
+        page = build()
+        with self._pages_lock:
+            self._pages[key] = page
+            while len(self._pages) > self.max_rendered_pages:
+                self._pages.popitem(last=False)
+        return page
+
     def update_docs_entrypoint(
-        self, urls: AssetUrl, app: FastAPI, url: str, lock: LockFunc | None = None
+        self,
+        urls: AssetUrl | AssetUrlHolder,
+        app: FastAPI,
+        url: str,
+        lock: LockFunc | None = None,
     ) -> None:
-        async def swagger_ui_html(req: Request) -> HTMLResponse:
-            await self.try_request_lock(req, lock)
-            root_path = req.scope.get("root_path", "").rstrip("/")
+        holder = self.to_holder(urls)
+        # Compile once, so that verdict cache and thread limit apply across requests
+        compiled = CompiledLock.build(lock)
+
+        def render(root_path: str, urls: AssetUrl, openapi_url: str) -> RenderedPage:
             asset_urls = CdnHostBuilder.fill_root_path(urls, root_path)
-            openapi_url = root_path + getattr(app, "openapi_url", "")
             if oauth2_redirect_url := getattr(
                 app, "swagger_ui_oauth2_redirect_url", ""
             ):
@@ -492,35 +2468,230 @@ class DocsBuilder:
             kw: dict[str, str] = {}
             if urls.favicon:
                 kw["swagger_favicon_url"] = urls.favicon
-            return get_swagger_ui_html(
-                openapi_url=openapi_url,
+            spec_url, parameters, spec_urls = self.get_swagger_ui_parameters(
+                app, openapi_url
+            )
+            response = get_swagger_ui_html(
+                openapi_url=spec_url,
                 title=f"{getattr(app, 'title', '')} - Swagger UI",
                 swagger_js_url=asset_urls.js,
                 swagger_css_url=asset_urls.css,
                 oauth2_redirect_url=oauth2_redirect_url,
                 init_oauth=getattr(app, "swagger_ui_init_oauth", None),
-                swagger_ui_parameters=getattr(app, "swagger_ui_parameters", None),
+                swagger_ui_parameters=parameters or None,
                 **kw,
             )
+            if spec_urls:
+                html = self.add_spec_selector(bytes(response.body).decode(), spec_urls)
+                response = HTMLResponse(html)
+            links = (
+                self.build_links(
+                    [
+                        (asset_urls.css, "style"),
+                        (asset_urls.js, "script"),
+                        (spec_url, "fetch"),
+                    ]
+                )
+                if self.resource_hints
+                else ()
+            )
+            return RenderedPage.from_response(response, links)
+
+        async def swagger_ui_html(req: Request) -> Response:
+            await self.try_request_lock(req, compiled)
+            root_path = req.scope.get("root_path", "").rstrip("/")
+            openapi_url = self.get_openapi_url(app, req, root_path)
+            urls = holder.urls
+            page = self.render_once(
+                (root_path, urls, openapi_url),
+                lambda: render(root_path, urls, openapi_url),
+            )
+            return await self.respond(req, page, lock)
 
         self.update_entrypoint(swagger_ui_html, app, url)
 
     def update_redoc_entrypoint(
-        self, urls: AssetUrl, app: FastAPI, url: str, lock: LockFunc | None = None
+        self,
+        urls: AssetUrl | AssetUrlHolder,
+        app: FastAPI,
+        url: str,
+        lock: LockFunc | None = None,
     ) -> None:
-        async def redoc_html(req: Request) -> HTMLResponse:
-            await self.try_request_lock(req, lock)
-            root_path = req.scope.get("root_path", "").rstrip("/")
+        holder = self.to_holder(urls)
+        compiled = CompiledLock.build(lock)
+
+        def render(root_path: str, urls: AssetUrl, openapi_url: str) -> RenderedPage:
             asset_urls = CdnHostBuilder.fill_root_path(urls, root_path)
-            openapi_url = root_path + getattr(app, "openapi_url", "")
-            return get_redoc_html(
+            response = get_redoc_html(
                 openapi_url=openapi_url,
                 redoc_js_url=asset_urls.redoc,
                 title=f"{getattr(app, 'title', '')} - ReDoc",
             )
+            links = (
+                self.build_links([(asset_urls.redoc, "script"), (openapi_url, "fetch")])
+                if self.resource_hints
+                else ()
+            )
+            return RenderedPage.from_response(response, links)
+
+        async def redoc_html(req: Request) -> Response:
+            await self.try_request_lock(req, compiled)
+            root_path = req.scope.get("root_path", "").rstrip("/")
+            openapi_url = self.get_openapi_url(app, req, root_path)
+            urls = holder.urls
+            page = self.render_once(
+                (root_path, urls, openapi_url),
+                lambda: render(root_path, urls, openapi_url),
+            )
+            return await self.respond(req, page, lock)
 
         self.update_entrypoint(redoc_html, app, url)
 
+    def update_openapi_entrypoint(
+        self, app: FastAPI, url: str, lock: LockFunc | None = None
+    ) -> None:
+        """Serve openapi document that serialized and compressed only once"""
+        compiled = CompiledLock.build(lock)
+
+        def render(root_path: str) -> RenderedPage:
+            schema = self.get_openapi_schema(app, root_path)
+            response = Response(dump_json(schema), media_type="application/json")
+            return RenderedPage.from_response(response, compressed=True)
+
+        async def openapi(req: Request) -> Response:
+            await self.try_request_lock(req, compiled)
+            root_path = req.scope.get("root_path", "").rstrip("/")
+            page = self.render_once(root_path, lambda: render(root_path))
+            return await self.respond(req, page, lock)
+
+        self.update_entrypoint(openapi, app, url)
+
+    def add_tag_openapi_entrypoint(
+        self, app: FastAPI, openapi_url: str, lock: LockFunc | None = None
+    ) -> None:
+        """Serve sub-specs of each tag at '/openapi/{tag}.json'"""
+        compiled = CompiledLock.build(lock)
+
+        def render(root_path: str, tag: str) -> RenderedPage:
+            schema = self.get_openapi_schema(app, root_path)
+            spec = OpenapiSplitter.sub_spec(schema, tag)
+            response = Response(dump_json(spec), media_type="application/json")
+            return RenderedPage.from_response(response, compressed=True)
+
+        async def tag_openapi(req: Request, tag: str) -> Response:
+            await self.try_request_lock(req, compiled)
+            if tag not in self.get_spec_tags(app):
+                raise HTTPException(status_code=404, detail=f"Tag {tag!r} not found")
+            root_path = req.scope.get("root_path", "").rstrip("/")
+            page = self.render_once((root_path, tag), lambda: render(root_path, tag))
+            return await self.respond(req, page, lock)
+
+        path = OpenapiSplitter.tag_url(openapi_url, "{tag}").replace(
+            "%7Btag%7D", "{tag}"
+        )
+        # Appended like `app.add_api_route`, so user routes are not shadowed
+        app.router.routes.append(APIRoute(path, tag_openapi, include_in_schema=False))
+
+
+class StaticIndex:
+    """Docs asset files of a static directory, found by one `os.scandir` walk
+    or from its `asset-manifest.json` (written by `fastcdn offline`)
+
+    :param root: the static directory
+    :param files: {kind: [(priority, path), ...]}, kind is css/js/redoc/favicon
+    """
+
+    manifest_name = "asset-manifest.json"
+    # Do not walk deeper than this, media files are usually nested deeply
+    max_depth = 5
+    ignore_patterns: ClassVar[tuple[str, ...]] = (".*", "__pycache__", "node_modules")
+    # Kind of asset and its file name patterns, in the order of priority
+    patterns: ClassVar[dict[str, tuple[str, ...]]] = {
+        "css": ("swagger-ui*.css",),
+        "js": ("swagger-ui*.js",),
+        "redoc": (CdnHostBuilder.redoc_file,),
+        "favicon": ("favicon.png", "favicon.ico"),
+    }
+
+    def __init__(self, root: Path, files: dict[str, list[tuple[int, Path]]]) -> None:
+        self.root = root
+        self.files = files
+
+    @classmethod
+    def match(cls, name: str) -> tuple[str, int] | None:
+        for kind, patterns in cls.patterns.items():
+            for priority, pattern in enumerate(patterns):
+                if fnmatch.fnmatch(name, pattern):
+                    return kind, priority
+        return None
+
+    @classmethod
+    def ignored(cls, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, p) for p in cls.ignore_patterns)
+
+    @classmethod
+    def scan(cls, root: Path, max_depth: int | None = None) -> StaticIndex:
+        if max_depth is None:
+            max_depth = cls.max_depth
+        files: dict[str, list[tuple[int, Path]]] = {}
+        todo = [(str(root), 0)]
+        while todo:
+            directory, depth = todo.pop()
+            try:
+                it = os.scandir(directory)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth < max_depth and not cls.ignored(entry.name):
+                            todo.append((entry.path, depth + 1))
+                    elif matched := cls.match(entry.name):
+                        kind, priority = matched
+                        files.setdefault(kind, []).append((priority, Path(entry.path)))
+        return cls(root, files)
+
+    @classmethod
+    def from_manifest(cls, root: Path) -> StaticIndex | None:
+        try:
+            manifest = json.loads((root / cls.manifest_name).read_bytes())
+        except (OSError, ValueError):
+            return None
+        files: dict[str, list[tuple[int, Path]]] = {}
+        unknown: list[str] = []
+        for kind in cls.patterns:
+            if (name := manifest.get(kind, "")) is None:
+                continue  # Recorded as not exist
+            if name and (path := root / name).is_file():
+                files[kind] = [(0, path)]
+            else:
+                unknown.append(kind)
+        if "css" not in files:  # Outdated manifest
+            return None
+        if unknown:  # e.g.: favicon was not recorded by older version
+            scanned = cls.scan(root)
+            files.update((k, v) for k in unknown if (v := scanned.files.get(k)))
+        return cls(root, files)
+
+    @classmethod
+    def load(cls, root: Path) -> StaticIndex:
+        return cls.from_manifest(root) or cls.scan(root)
+
+    @classmethod
+    def write_manifest(cls, root: Path, files: dict[str, str | None]) -> Path:
+        """Save {kind: relative path} of asset files to the manifest,
+        None for kind that not exists, missing kinds will be scanned"""
+        path = root / cls.manifest_name
+        path.write_text(json.dumps(files, indent=2))
+        return path
+
+    def latest(self, kind: str) -> Path | None:
+        """The newest file of the highest priority pattern"""
+        if not (found := self.files.get(kind)):
+            return None
+        top = min(priority for priority, _ in found)
+        return StaticBuilder.get_latest_one([p for i, p in found if i == top])
+
 
 class StaticBuilder:
     def __init__(
@@ -545,10 +2716,11 @@ class StaticBuilder:
     ) -> AssetUrl | None:
         if isinstance(static_root, str):
             static_root = Path(static_root)
-        if gs := list(static_root.rglob("swagger-ui*.css")):
+        index = StaticIndex.load(static_root)
+        if "css" in index.files:
             logger.info(f"Using local files in {static_root} to serve docs assets.")
             return self._generate_asset_urls_from_local_files(
-                gs, mount, app, static_root, favicon
+                index, mount, app, static_root, favicon
             )
         return None
 
@@ -587,7 +2759,7 @@ class StaticBuilder:
 
     def _generate_asset_urls_from_local_files(
         self,
-        gs: list[Path],
+        index: StaticIndex,
         mount: Mount | None = None,
         app: FastAPI | None = None,
         static_root: Path | None = None,
@@ -601,32 +2773,19 @@ class StaticBuilder:
             uri_path = self.auto_mount_static(app, static_root)
         else:
             raise RuntimeError("Argument 'mount' and 'app' can't not both be None")
-        css_file = self.get_latest_one(gs)
-        js_file = (
-            self.get_latest_one(_js)
-            if (_js := list(static_root.rglob("swagger-ui*.js")))
-            else (css_file.with_name(CdnHostBuilder.swagger_files["js"]))
+        css_file = cast(Path, index.latest("css"))
+        js_file = index.latest("js") or css_file.with_name(
+            CdnHostBuilder.swagger_files["js"]
         )
-        redoc_name = CdnHostBuilder.redoc_file
-
-        redoc_file = (
-            self.get_latest_one(_redoc)
-            if (_redoc := list(static_root.rglob(redoc_name)))
-            else (css_file.with_name(redoc_name))
+        redoc_file = index.latest("redoc") or css_file.with_name(
+            CdnHostBuilder.redoc_file
         )
 
         css = self.file_to_uri(css_file, static_root, uri_path)
         js = self.file_to_uri(js_file, static_root, uri_path)
         redoc = self.file_to_uri(redoc_file, static_root, uri_path)
-        if favicon is None:
-            favicon = favicon_file = None
-            if _favicon := (
-                list(static_root.rglob("favicon.png"))
-                or list(static_root.rglob("favicon.ico"))
-            ):
-                favicon_file = self.get_latest_one(_favicon)
-            if favicon_file is not None:
-                favicon = self.file_to_uri(favicon_file, static_root, uri_path)
+        if favicon is None and (favicon_file := index.latest("favicon")) is not None:
+            favicon = self.file_to_uri(favicon_file, static_root, uri_path)
         return AssetUrl(css=css, js=js, redoc=redoc, favicon=favicon)
 
     def detect_local_file(
@@ -650,10 +2809,10 @@ class StaticBuilder:
         return None
 
 
-def _parse_asset_url(cdn_host, favicon_url, cache, app) -> AssetUrl:
+def _parse_asset_url(cdn_host, favicon_url, cache, app, **kw: Any) -> AssetUrl:
     if isinstance(cdn_host, AssetUrl):
         if favicon_url is not None and favicon_url != cdn_host.favicon:
-            cdn_host.favicon = favicon_url
+            cdn_host = replace(cdn_host, favicon=favicon_url)
         return cdn_host
     if isinstance(cdn_host, str):
         if cdn_host == "local":
@@ -661,7 +2820,7 @@ def _parse_asset_url(cdn_host, favicon_url, cache, app) -> AssetUrl:
         else:
             with contextlib.suppress(KeyError):
                 cdn_host = CdnHostEnum[cdn_host]
-    return CdnHostBuilder(app, cdn_host, favicon_url, cache).run()
+    return CdnHostBuilder(app, cdn_host, favicon_url, cache, **kw).run()
 
 
 def patch_docs(
@@ -678,6 +2837,19 @@ def patch_docs(
     cache: bool = True,
     *,
     docs_cdn_host: DocsCdnHostType | None = None,  # For backward compatibility
+    per_asset: bool = False,
+    startup_budget_ms: int | None = None,
+    provisional: AssetUrl | None = None,
+    refresh_interval: float | None = None,
+    cache_control: str | None = None,
+    resource_hints: bool = True,
+    early_hints: bool = False,
+    serve_openapi: bool = False,
+    split_by_tag: bool = False,
+    lock_cache_ttl: float | None = None,
+    lock_threads: int | None = 8,
+    lock_timeout: float | None = None,
+    lock_cache_key: Callable[[Request], str] | None = None,
 ) -> None:
     """Use local static files or the faster CDN host for docs asset(swagger-ui)
 
@@ -686,6 +2858,33 @@ def patch_docs(
     :param favicon_url: docs page logo
     :param lock: function that receive a request argument to verify it
     :param cache: whether cache race result in disk
+    :param per_asset: whether choose cdn host for css/js/redoc independently
+    :param startup_budget_ms: if not None, wait at most this milliseconds for
+        the cdn race, then serve `provisional`(default to the first candidate)
+        and swap in the winner when the race finished in background
+    :param provisional: asset urls to use before the background race finished
+    :param refresh_interval: if not None, re-race cdn hosts every this seconds
+        during app lifespan, and failover when current host is down
+    :param cache_control: Cache-Control header of docs pages, default to
+        'no-cache'(or 'private, no-cache' when lock is set)
+    :param resource_hints: whether add `Link` header to preconnect cdn host and
+        preload css/js/openapi of docs pages
+    :param early_hints: whether send the `Link` header as 103 Early Hints
+        before the docs page, if the ASGI server supports it
+    :param serve_openapi: whether take over `app.openapi_url` to serve the
+        openapi document that serialized/compressed only once, with ETag and
+        the same `lock` as docs pages
+    :param split_by_tag: whether publish sub-spec of each tag at
+        '/openapi/{tag}.json', and let swagger-ui load them one by one
+    :param lock_cache_ttl: if not None, skip the lock for this seconds for a
+        client that passed it with the same credential. Only client host, query
+        string, Authorization and Cookie headers are compared by default, pass
+        `lock_cache_key` if the lock reads any other part of the request
+    :param lock_threads: max number of worker threads that run a sync lock
+        concurrently, None to run it inline (async lock always runs inline)
+    :param lock_timeout: if not None, respond 503 when the lock cost more seconds
+    :param lock_cache_key: function that receive a request and return the
+        credential that `lock_cache_ttl` is keyed by
     """
     openapi_url = getattr(app, "openapi_url", "")
     docs_url, redoc_url = getattr(app, "docs_url", ""), getattr(app, "redoc_url", "")
@@ -694,14 +2893,44 @@ def patch_docs(
         return
     if cdn_host is None and docs_cdn_host is not None:
         cdn_host = docs_cdn_host
-    urls = _parse_asset_url(cdn_host, favicon_url, cache, app)
+    holder = AssetUrlHolder()
+    urls = _parse_asset_url(
+        cdn_host,
+        favicon_url,
+        cache,
+        app,
+        per_asset=per_asset,
+        startup_budget_ms=startup_budget_ms,
+        provisional=provisional,
+        holder=holder,
+        refresh_interval=refresh_interval,
+    )
+    holder.set_default(urls)
     route_index: dict[str, int] = {
         getattr(route, "path", ""): index for index, route in enumerate(app.routes)
     }
+    compiled_lock = CompiledLock.build(
+        lock, lock_cache_ttl, lock_threads, lock_timeout, lock_cache_key
+    )
+    builder = functools.partial(
+        DocsBuilder,
+        cache_control=cache_control,
+        resource_hints=resource_hints,
+        early_hints=early_hints,
+        openapi_query=(serve_openapi or split_by_tag) and compiled_lock is not None,
+    )
     if docs_url and (index := route_index.get(docs_url)) is not None:
-        DocsBuilder(index).update_docs_entrypoint(urls, app, docs_url, lock=lock)
+        builder(index, split_by_tag=split_by_tag).update_docs_entrypoint(
+            holder, app, docs_url, lock=compiled_lock
+        )
     if redoc_url and (index := route_index.get(redoc_url)) is not None:
-        DocsBuilder(index).update_redoc_entrypoint(urls, app, redoc_url, lock=lock)
+        builder(index).update_redoc_entrypoint(
+            holder, app, redoc_url, lock=compiled_lock
+        )
+    if serve_openapi and (index := route_index.get(openapi_url)) is not None:
+        builder(index).update_openapi_entrypoint(app, openapi_url, lock=compiled_lock)
+    if split_by_tag and (index := route_index.get(openapi_url)) is not None:
+        builder(index).add_tag_openapi_entrypoint(app, openapi_url, lock=compiled_lock)
 
 
 monkey_patch_for_docs_ui = patch_docs  # For backward compatibility
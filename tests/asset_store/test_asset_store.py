@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from fastapi_cdn_host import cli
+from fastapi_cdn_host.client import AssetStore, AssetUrl, CdnHostBuilder, HttpSniff
+
+NAMES = [*CdnHostBuilder.swagger_files.values(), CdnHostBuilder.redoc_file]
+
+
+def test_asset_store(tmp_path):
+    store = AssetStore(tmp_path / "assets")
+    digest = store.add(b"body{}")
+    assert store.add(b"body{}") == digest
+    assert store.blob_path(digest).read_bytes() == b"body{}"
+    assert store.lookup("5.0.0", ["swagger-ui.css"]) is None
+    store.record("5.0.0", {"swagger-ui.css": digest})
+    assert store.lookup("5.0.0", ["swagger-ui.css"]) == {"swagger-ui.css": digest}
+    assert store.lookup("5.0.0", NAMES) is None
+    assert store.lookup("6.0.0", ["swagger-ui.css"]) is None
+    dest = tmp_path / "static" / "swagger-ui.css"
+    dest.parent.mkdir()
+    assert store.link(digest, dest) == "hardlink"
+    assert dest.read_bytes() == b"body{}"
+    assert os.path.samefile(dest, store.blob_path(digest))
+    # Linked files stay writable, an edited blob is not reused but restored
+    dest.write_bytes(b"body{color:red}")
+    assert store.lookup("5.0.0", ["swagger-ui.css"]) is None
+    assert store.add(b"body{}") == digest
+    assert store.lookup("5.0.0", ["swagger-ui.css"]) == {"swagger-ui.css": digest}
+    assert dest.read_bytes() == b"body{color:red}"
+
+
+def test_link_fallback_to_copy(mocker, tmp_path):
+    store = AssetStore(tmp_path / "assets")
+    digest = store.add(b"a")
+    mocker.patch("os.link", side_effect=OSError("Invalid cross-device link"))
+    dest = tmp_path / "a.js"
+    assert store.link(digest, dest) == "copy"
+    assert dest.read_bytes() == b"a"
+
+
+@pytest.mark.anyio
+async def test_offline_reuse_store(mocker, tmp_path):
+    mocker.patch.object(AssetStore, "__init__", _init_with(tmp_path / "assets"))
+    urls = AssetUrl(*(f"https://cdn.com/{name}" for name in NAMES))
+    sniff = mocker.patch.object(CdnHostBuilder, "sniff_the_fastest", return_value=urls)
+    fetch = mocker.patch.object(
+        HttpSniff,
+        "bulk_fetch",
+        side_effect=lambda urls, **kw: [url.split("/")[-1].encode() for url in urls],
+    )
+    await cli.download_offline_assets(tmp_path / "project_a" / "static")
+    assert sniff.call_count == fetch.call_count == 1
+    await cli.download_offline_assets(tmp_path / "project_b" / "static")
+    assert sniff.call_count == fetch.call_count == 1  # Read from store
+    for name in NAMES:
+        a = tmp_path / "project_a" / "static" / name
+        b = tmp_path / "project_b" / "static" / name
+        assert a.read_text() == b.read_text() == name
+        assert os.path.samefile(a, b)
+
+
+def _init_with(root):
+    origin = AssetStore.__init__
+
+    def init(self, root_=None):
+        origin(self, root)
+
+    return init
@@ -0,0 +1,4 @@
+PORT = 8621
+MY_CDN = f"http://127.0.0.1:{PORT}"
+MISSING_HOST = MY_CDN + "/missing"
+SLOW_HOST = MY_CDN + "/slow"
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+from pathlib import Path
+
+import uvicorn
+from config import MISSING_HOST, SLOW_HOST
+from fastapi import FastAPI
+
+import fastapi_cdn_host
+from fastapi_cdn_host import AssetUrl
+
+app = FastAPI(title="FastAPI CDN host test")
+app_provisional = FastAPI(title="FastAPI CDN host test")
+choices: list = [(MISSING_HOST, ("/", "/")), (SLOW_HOST, ("/", "/"))]
+provisional = AssetUrl(
+    css="/static/swagger-ui.css",
+    js="/static/swagger-ui-bundle.js",
+    redoc="/static/redoc.standalone.js",
+)
+
+
+def patch() -> None:
+    fastapi_cdn_host.patch_docs(app, choices, cache=False, startup_budget_ms=0)
+    fastapi_cdn_host.patch_docs(
+        app_provisional,
+        choices,
+        cache=False,
+        startup_budget_ms=10,
+        provisional=provisional,
+    )
+
+
+if __name__ == "__main__":
+    patch()
+    uvicorn.run(f"{Path(__file__).stem}:app", reload=True)
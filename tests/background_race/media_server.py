@@ -0,0 +1,11 @@
+import anyio
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+app = FastAPI()
+
+
+@app.get("/slow/{path:path}")
+async def slow_asset(path: str) -> PlainTextResponse:
+    await anyio.sleep(0.3)
+    return PlainTextResponse(f"/* {path} */")
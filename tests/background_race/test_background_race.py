@@ -0,0 +1,92 @@
+# mypy: no-disallow-untyped-decorators
+import sys
+import time
+from pathlib import Path
+
+import anyio
+import pytest
+from config import MISSING_HOST, PORT, SLOW_HOST
+from fastapi import FastAPI
+from httpx import AsyncClient
+from main import app, app_provisional, choices, patch, provisional
+
+from fastapi_cdn_host.client import CdnHostBuilder, RaceCache
+from fastapi_cdn_host.utils import TestClient
+
+try:
+    from tests.http_race.utils import UvicornServer
+except ImportError:
+    _path = Path(__file__).parent.parent / "http_race"
+    sys.path.append(_path.as_posix())
+    from utils import UvicornServer  # type: ignore[no-redef]
+
+
+async def wait_for_swap(client: AsyncClient, expected: str) -> str:
+    for _ in range(100):
+        text = (await client.get("/docs")).text
+        if expected in text:
+            break
+        await anyio.sleep(0.05)
+    return text
+
+
+@pytest.mark.anyio
+async def test_docs():
+    slow_css = SLOW_HOST + "/swagger-ui.css"
+    with UvicornServer("media_server:app", port=PORT).run_in_thread():
+        start = time.perf_counter()
+        patch()
+        assert time.perf_counter() - start < 0.2
+        async with TestClient(app) as client, TestClient(app_provisional) as c2:
+            response = await client.get("/docs")
+            assert response.status_code == 200
+            assert f'"{MISSING_HOST}/swagger-ui.css"' in response.text
+            response = await c2.get("/docs")
+            assert f'"{provisional.css}"' in response.text
+            text = await wait_for_swap(client, slow_css)
+            assert f'"{slow_css}"' in text
+            assert f'"{SLOW_HOST}/swagger-ui-bundle.js"' in text
+            response = await client.get("/redoc")
+            assert f'"{SLOW_HOST}/redoc.standalone.js"' in response.text
+            text = await wait_for_swap(c2, slow_css)
+            assert f'"{slow_css}"' in text
+
+
+def test_within_budget():
+    with UvicornServer("media_server:app", port=PORT).run_in_thread():
+        builder = CdnHostBuilder(
+            FastAPI(), choices, cache=False, startup_budget_ms=5000
+        )
+        urls = builder.run()
+        assert urls.css == SLOW_HOST + "/swagger-ui.css"
+        assert builder.holder.ready.is_set()
+        assert builder.holder.urls is urls
+
+
+def test_background_failed(mocker):
+    mocker.patch.object(CdnHostBuilder, "_soonify_sniff", side_effect=ValueError)
+    builder = CdnHostBuilder(FastAPI(), choices, cache=False, startup_budget_ms=100)
+    urls = builder.run()
+    assert urls.css == MISSING_HOST + "/swagger-ui.css"
+    assert builder.holder.ready.is_set()  # waiters won't hang
+    assert builder.holder.urls is urls
+
+
+def test_expired_cache_as_provisional(mocker, tmp_path: Path):
+    file = tmp_path / "race.json"
+    record = RaceCache(
+        css=SLOW_HOST + "/swagger-ui.css",
+        js=SLOW_HOST + "/swagger-ui-bundle.js",
+        redoc=SLOW_HOST + "/redoc.standalone.js",
+        fingerprint=CdnHostBuilder.cache_fingerprint(choices),
+        swagger_ui_version=CdnHostBuilder.swagger_ui_full_version,
+        created_at=time.time() - 100,
+        ttl=10,
+    )
+    CdnHostBuilder.save_cache(file, record)
+    mocker.patch.object(CdnHostBuilder, "get_cache_file", return_value=(True, file))
+    mocker.patch.object(CdnHostBuilder, "_soonify_sniff", side_effect=ValueError)
+    builder = CdnHostBuilder(FastAPI(), choices, cache=True, startup_budget_ms=100)
+    urls = builder.run()
+    assert urls.css == record.css and urls.redoc == record.redoc
+    assert builder.holder.ready.is_set()
@@ -4,6 +4,9 @@ import os
 import re
 import shutil
 import sys
+import threading
+import time
+from dataclasses import replace
 from pathlib import Path
 
 import main
@@ -11,7 +14,15 @@ import pytest
 from httpx import AsyncClient
 from main import app
 
-from fastapi_cdn_host.client import AssetUrl, CdnHostBuilder, CdnHostEnum, HttpSniff
+from fastapi_cdn_host.client import (
+    AssetUrl,
+    CacheFileLock,
+    CdnHostBuilder,
+    CdnHostEnum,
+    HttpSniff,
+    RaceCache,
+    RaceCacheStore,
+)
 from fastapi_cdn_host.utils import TestClient
 
 default_favicon_url = "https://fastapi.tiangolo.com/img/favicon.png"
@@ -34,7 +45,7 @@ async def _run_test(cache_file, urls, client, cache_already_exists=False):
     text2 = response2.text
     assert response2.status_code == 200, text2
     assert cache_file.exists()
-    file_lines = cache_file.read_text("utf8").strip().splitlines()
+    file_lines = _read_cached_urls(cache_file)
     if cache_already_exists:
         if "jsdelivr.net" in file_lines[0]:
             css, js, redoc = (_slim_url(i) for i in file_lines)
@@ -47,6 +58,12 @@ async def _run_test(cache_file, urls, client, cache_already_exists=False):
         await _run_test_2(cache_file, urls, client, file_lines, text, text2)
 
 
+def _read_cached_urls(cache_file: Path) -> list[str]:
+    store = RaceCacheStore.loads(cache_file.read_text("utf8"))
+    record = store.entries[CdnHostBuilder.cache_fingerprint()]
+    return [record.css, record.js, record.redoc]
+
+
 def _slim_url(s: str) -> str:  # TODO: remove this
     # Fix fastly.jsdelivr.net != cdn.jsdelivr.net
     return s.split("://", 1)[-1].split(".", 1)[-1]
@@ -67,7 +84,7 @@ async def _run_test_2(cache_file, urls, client, file_lines, text, text2):
                 redoc_url = m.group(1)
                 print(f"{m.group() = }; {redoc_url=}")
                 if urls.redoc != redoc_url:
-                    urls.redoc = redoc_url
+                    urls = replace(urls, redoc=redoc_url)
                 # TODO:
                 # urls.css = url
                 # urls.js = get_js_url_from_css(url)
@@ -90,9 +107,9 @@ async def _run_test_2(cache_file, urls, client, file_lines, text, text2):
 
 @pytest.mark.anyio
 async def test_docs(client: AsyncClient):  # nosec
-    cache_file = Path.home() / ".cache" / "fastapi-cdn-host" / "urls.txt"
+    cache_file = Path.home() / ".cache" / "fastapi-cdn-host" / "race.json"
     if cache_already_exists := cache_file.exists():
-        lines = cache_file.read_text("utf8").splitlines()
+        lines = _read_cached_urls(cache_file)
         urls = AssetUrl(css=lines[0], js=lines[1], redoc=lines[2])
     else:
         urls = await CdnHostBuilder.sniff_the_fastest()
@@ -100,9 +117,10 @@ async def test_docs(client: AsyncClient):  # nosec
 
     if cache_already_exists:
         shutil.rmtree(cache_file.parent)
+        CdnHostBuilder.clear_cache_memo()
         urls = await CdnHostBuilder.sniff_the_fastest()
     else:
-        lines = cache_file.read_text("utf8").splitlines()
+        lines = _read_cached_urls(cache_file)
         urls = AssetUrl(css=lines[0], js=lines[1], redoc=lines[2])
     importlib.reload(main)
     await _run_test(cache_file, urls, client, not cache_already_exists)
@@ -122,6 +140,178 @@ def test_cache_file(mocker, tmp_path):
     if sys.platform == "win32":
         temp_directory_env_name = "temp"
         temp_dir = Path(os.getenv(temp_directory_env_name, "."))
-        assert cache_file == temp_dir / ".cache/fastapi-cdn-host/urls.txt"
+        assert cache_file == temp_dir / ".cache/fastapi-cdn-host/race.json"
     else:
-        assert cache_file.as_posix() == "/tmp/.cache/fastapi-cdn-host/urls.txt"
+        assert cache_file.as_posix() == "/tmp/.cache/fastapi-cdn-host/race.json"
+
+
+def _load_record(file: Path, fingerprint: str | None = None) -> RaceCache:
+    store = RaceCacheStore.loads(file.read_text())
+    return store.entries[fingerprint or CdnHostBuilder.cache_fingerprint()]
+
+
+def _overwrite(file: Path, content: str) -> None:
+    file.write_text(content)
+    CdnHostBuilder.clear_cache_memo()
+
+
+def test_race_cache(mocker, tmp_path):
+    file = tmp_path / "race.json"
+    mocker.patch.object(CdnHostBuilder, "get_cache_file", return_value=(False, file))
+    sniff = mocker.patch.object(
+        CdnHostBuilder,
+        "_soonify_sniff",
+        return_value=AssetUrl(css="a.css", js="swagger-ui.js", redoc="redoc.js"),
+    )
+    urls = CdnHostBuilder(cache=True).run()
+    assert sniff.call_count == 1
+    record = _load_record(file)
+    assert record.css == urls.css == "a.css"
+    assert record.swagger_ui_version == CdnHostBuilder.swagger_ui_full_version
+    assert record.fingerprint == CdnHostBuilder.cache_fingerprint()
+    assert record.ttl == CdnHostBuilder.cache_ttl
+    assert record.version == RaceCache.VERSION
+    mocker.patch.object(CdnHostBuilder, "get_cache_file", return_value=(True, file))
+    urls = CdnHostBuilder(cache=True, favicon_url="https://a.com/b.ico").run()
+    assert sniff.call_count == 1  # Read from cache
+    assert urls.favicon == "https://a.com/b.ico"
+    # Candidates changed: a new entry is added, the old one kept
+    builder = CdnHostBuilder(cache=True)
+    assert builder._cache_wrap(sniff)(None, ["https://a.com"]).css == urls.css
+    assert sniff.call_count == 2
+    store = RaceCacheStore.loads(file.read_text())
+    other = CdnHostBuilder.cache_fingerprint(["https://a.com"])
+    assert set(store.entries) == {record.fingerprint, other}
+    CdnHostBuilder(cache=True).run()
+    builder._cache_wrap(sniff)(None, ["https://a.com"])
+    assert sniff.call_count == 2
+    # Expired
+    record.created_at -= record.ttl + 1
+    store.entries[record.fingerprint] = record
+    _overwrite(file, store.dumps())
+    CdnHostBuilder(cache=True).run()
+    assert sniff.call_count == 3
+    # Swagger ui version changed
+    mocker.patch.object(CdnHostBuilder, "swagger_ui_full_version", "6.0.0")
+    CdnHostBuilder(cache=True).run()
+    assert sniff.call_count == 4
+    CdnHostBuilder(cache=True).run()
+    assert sniff.call_count == 4
+    # Invalid content or legacy formats
+    for content in ("a.css\nb.js\nredoc.js", "[]", '{"css": "a.css"}'):
+        _overwrite(file, content)
+        CdnHostBuilder(cache=True).run()
+    assert sniff.call_count == 7
+
+
+def test_cache_memo(mocker, tmp_path):
+    file = tmp_path / "race.json"
+    record = RaceCache("a.css", "a.js", "a.redoc.js", "fp", "5.0.0")
+    CdnHostBuilder.save_cache(file, record)
+    read_text = mocker.spy(Path, "read_text")
+    for _ in range(3):
+        store = CdnHostBuilder.load_cache(file)
+        assert store.get("fp", "5.0.0") == record
+    assert read_text.call_count == 0
+    CdnHostBuilder.clear_cache_memo()
+    assert CdnHostBuilder.load_cache(file).get("fp", "5.0.0") == record
+    assert read_text.call_count == 1
+    # Entry with mismatched key or bad fields is skipped
+    text = file.read_text().replace('"fingerprint": "fp"', '"fingerprint": "x"')
+    assert RaceCacheStore.loads(text).entries == {}
+    assert CdnHostBuilder.load_cache(tmp_path / "missing.json").entries == {}
+
+
+def test_cache_file_memo(mocker, tmp_path):
+    file = tmp_path / "race.json"
+    mocker.patch.object(CdnHostBuilder, "default_cache_file", file.as_posix())
+    sniff = mocker.patch.object(
+        CdnHostBuilder,
+        "_soonify_sniff",
+        return_value=AssetUrl(css="a.css", js="swagger-ui.js", redoc="redoc.js"),
+    )
+    CdnHostBuilder(cache=True).run()
+    read_bytes = mocker.spy(Path, "read_bytes")
+    read_text = mocker.spy(Path, "read_text")
+    for _ in range(5):
+        assert CdnHostBuilder(cache=True).run().css == "a.css"
+    assert sniff.call_count == 1
+    assert read_bytes.call_count == read_text.call_count == 0
+    CdnHostBuilder.clear_cache_memo()
+    CdnHostBuilder(cache=True).run()
+    assert read_bytes.call_count == read_text.call_count == 1
+
+
+def test_cache_fingerprint():
+    default = CdnHostBuilder.cache_fingerprint()
+    assert default == CdnHostBuilder.cache_fingerprint(list(CdnHostEnum))
+    assert default != CdnHostBuilder.cache_fingerprint(per_asset=True)
+    assert default != CdnHostBuilder.cache_fingerprint([CdnHostEnum.unpkg])
+
+
+def test_cache_lock(mocker, tmp_path):
+    file = tmp_path / "race.json"
+    mocker.patch.object(CdnHostBuilder, "get_cache_file", return_value=(False, file))
+    calls: list[int] = []
+
+    def slow_sniff(favicon, cdn_host=None):
+        calls.append(1)
+        time.sleep(0.2)
+        return AssetUrl(css="a.css", js="a.js", redoc="a.redoc.js")
+
+    def worker(results):
+        results.append(CdnHostBuilder(cache=True)._cache_wrap(slow_sniff)(None))
+
+    results: list[AssetUrl] = []
+    threads = [threading.Thread(target=worker, args=(results,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1  # Only the first one races, others reuse its result
+    assert [i.css for i in results] == ["a.css"] * 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["race.json", "race.json.lock"]
+    # Lock held by others for too long, race without it
+    file.unlink()
+    CdnHostBuilder.clear_cache_memo()
+    mocker.patch.object(CdnHostBuilder, "cache_lock_timeout", 0.1)
+    with CacheFileLock(file):
+        assert CdnHostBuilder(cache=True)._cache_wrap(slow_sniff)(None).js == "a.js"
+    assert len(calls) == 2
+    with (
+        CacheFileLock(file, timeout=0.1),
+        pytest.raises(TimeoutError),
+        CacheFileLock(file, timeout=0.1),
+    ):
+        pass
+
+
+def test_stale_while_revalidate(mocker, tmp_path):
+    file = tmp_path / "race.json"
+    mocker.patch.object(CdnHostBuilder, "get_cache_file", return_value=(True, file))
+    old = AssetUrl(css="old.css", js="old.js", redoc="old.redoc.js")
+    new = AssetUrl(css="new.css", js="new.js", redoc="new.redoc.js")
+    sniff = mocker.patch.object(CdnHostBuilder, "_soonify_sniff", return_value=old)
+    assert CdnHostBuilder(cache=True).run().css == "old.css"
+    record = _load_record(file)
+    assert record.soft_ttl == CdnHostBuilder.cache_soft_ttl
+    assert not record.stale
+    # Older than soft ttl: serve cached one and race again in background
+    record.created_at -= record.soft_ttl + 1
+    CdnHostBuilder.save_cache(file, record)
+    sniff.return_value = new
+    builder = CdnHostBuilder(cache=True)
+    assert builder.run().css == "old.css"
+    assert builder.revalidating is not None
+    builder.revalidating.join()
+    assert sniff.call_count == 2
+    assert _load_record(file).css == "new.css"
+    builder = CdnHostBuilder(cache=True)
+    assert builder.run().css == "new.css"
+    assert builder.revalidating is None
+    # Older than hard ttl: race before startup
+    record.created_at -= record.ttl
+    CdnHostBuilder.save_cache(file, record)
+    sniff.return_value = old
+    assert CdnHostBuilder(cache=True).run().css == "old.css"
+    assert sniff.call_count == 3
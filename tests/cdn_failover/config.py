@@ -0,0 +1,4 @@
+PORT = 8623
+MY_CDN = f"http://127.0.0.1:{PORT}"
+HOST_A = MY_CDN + "/a"
+HOST_B = MY_CDN + "/b"
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+from pathlib import Path
+
+import uvicorn
+from config import HOST_A, HOST_B
+from fastapi import FastAPI
+
+import fastapi_cdn_host
+
+app = FastAPI(title="FastAPI CDN host test")
+choices: list = [(HOST_A, ("/", "/")), (HOST_B, ("/", "/"))]
+
+
+def patch() -> None:
+    fastapi_cdn_host.patch_docs(app, choices, cache=False, refresh_interval=0.1)
+
+
+if __name__ == "__main__":
+    patch()
+    uvicorn.run(f"{Path(__file__).stem}:app", reload=True)
@@ -0,0 +1,15 @@
+import anyio
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+app = FastAPI()
+DOWN: set[str] = set()
+DELAY: dict[str, float] = {"a": 0, "b": 0.05}
+
+
+@app.get("/{host}/{path:path}")
+async def asset(host: str, path: str) -> PlainTextResponse:
+    if host in DOWN:
+        raise HTTPException(status_code=503)
+    await anyio.sleep(DELAY.get(host, 0))
+    return PlainTextResponse(f"/* {host}: {path} */")
@@ -0,0 +1,121 @@
+# mypy: no-disallow-untyped-decorators
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+import media_server
+import pytest
+from config import HOST_A, HOST_B, PORT
+from fastapi.testclient import TestClient as SyncClient
+from main import app, choices, patch
+
+from fastapi_cdn_host.client import AssetUrlHolder, CdnHostBuilder, CdnMonitor
+
+try:
+    from tests.http_race.utils import UvicornServer
+except ImportError:
+    _path = Path(__file__).parent.parent / "http_race"
+    sys.path.append(_path.as_posix())
+    from utils import UvicornServer  # type: ignore[no-redef]
+
+
+@pytest.fixture
+def media():
+    with UvicornServer("media_server:app", port=PORT).run_in_thread():
+        yield media_server
+    media_server.DOWN.clear()
+    media_server.DELAY.update(a=0, b=0.05)
+
+
+def build_holder(host: str) -> AssetUrlHolder:
+    holder = AssetUrlHolder()
+    holder.swap(CdnHostBuilder.build_asset_url(host, ("/", "/")))
+    return holder
+
+
+@pytest.mark.anyio
+async def test_failover(media):
+    holder = build_holder(HOST_A)
+    monitor = CdnMonitor(holder, choices, samples=1, max_failures=2)
+    assert await monitor.check() is True
+    assert holder.urls.css == HOST_A + "/swagger-ui.css"
+    media.DOWN.add("a")
+    assert await monitor.check() is True
+    assert monitor.failures == 1
+    assert holder.urls.css == HOST_A + "/swagger-ui.css"
+    assert await monitor.check() is True
+    assert holder.urls.css == HOST_B + "/swagger-ui.css"
+    assert holder.urls.js == HOST_B + "/swagger-ui-bundle.js"
+    assert monitor.failures == 0
+    media.DOWN.add("b")
+    assert await monitor.check() is False  # All down
+    assert holder.urls.css == HOST_B + "/swagger-ui.css"
+
+
+@pytest.mark.anyio
+async def test_failover_per_asset(media):
+    holder = build_holder(HOST_A)
+    js_b = CdnHostBuilder.build_asset_url(HOST_B, ("/", "/")).js
+    holder.swap(replace(holder.urls, js=js_b))
+    monitor = CdnMonitor(holder, choices, samples=1, max_failures=2, per_asset=True)
+    media.DOWN.add("b")
+    assert await monitor.check() is True
+    assert monitor.failures_of == {"css": 0, "js": 1, "redoc": 0}
+    assert holder.urls.js == js_b
+    assert await monitor.check() is True
+    assert holder.urls.js == HOST_A + "/swagger-ui-bundle.js"
+    assert holder.urls.css == HOST_A + "/swagger-ui.css"
+    media.DOWN.clear()
+    media.DOWN.add("a")
+    for _ in range(2):
+        await monitor.check()
+    assert holder.urls.css == HOST_B + "/swagger-ui.css"
+    assert holder.urls.js == js_b
+
+
+@pytest.mark.anyio
+async def test_hysteresis(media):
+    holder = build_holder(HOST_B)
+    monitor = CdnMonitor(holder, choices, samples=1, patience=2, hysteresis=0.3)
+    media.DELAY.update(a=0.05, b=0.06)  # Faster but not enough
+    await monitor.check()
+    assert monitor.streak == 0
+    media.DELAY.update(a=0, b=0.1)
+    await monitor.check()
+    assert monitor.streak == 1
+    assert holder.urls.css == HOST_B + "/swagger-ui.css"
+    await monitor.check()
+    assert holder.urls.css == HOST_A + "/swagger-ui.css"
+    assert monitor.streak == 0
+
+
+@pytest.mark.anyio
+async def test_backoff(mocker):
+    monitor = CdnMonitor(build_holder(HOST_A), choices, interval=1, max_interval=5)
+    mocker.patch.object(monitor, "check", side_effect=[False, ValueError, False, True])
+    sleep = mocker.patch("anyio.sleep", side_effect=[None] * 4 + [RuntimeError])
+    with pytest.raises(RuntimeError):
+        await monitor.loop()
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2, 4, 5, 1]
+
+
+@pytest.mark.anyio
+async def test_not_ready():
+    monitor = CdnMonitor(AssetUrlHolder(), choices)
+    assert await monitor.check() is True
+    assert monitor.last_report is None
+
+
+def test_lifespan(media):
+    patch()
+    with SyncClient(app) as client:
+        assert f'"{HOST_A}/swagger-ui.css"' in client.get("/docs").text
+        media.DOWN.add("a")
+        for _ in range(50):
+            if f'"{HOST_B}/swagger-ui.css"' in (text := client.get("/docs").text):
+                break
+            time.sleep(0.1)
+        assert f'"{HOST_B}/swagger-ui-bundle.js"' in text
+        response = client.get("/redoc")
+        assert f'"{HOST_B}/redoc.standalone.js"' in response.text
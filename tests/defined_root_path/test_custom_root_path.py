@@ -38,3 +38,146 @@ async def test_docs(client: AsyncClient):  # nosec
     assert response.status_code == 200
     response = await client.get("/app")
     assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_docs_rendered_once(mocker):
+    from fastapi import FastAPI
+    from httpx import ASGITransport
+    from main import STATIC_ROOT
+
+    import fastapi_cdn_host
+
+    render = mocker.spy(fastapi_cdn_host.client, "get_swagger_ui_html")
+    app = FastAPI(title="Render once")
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT)
+    pages = {}
+    for root_path in ("", "/a", "", "/a", "/b"):
+        transport = ASGITransport(app=app, root_path=root_path)
+        async with AsyncClient(transport=transport, base_url="http://test") as c:
+            response = await c.get("/docs")
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert pages.setdefault(root_path, (etag, response.text)) == (
+            etag,
+            response.text,
+        )
+    assert render.call_count == 3
+    assert len({etag for etag, _ in pages.values()}) == 3
+
+
+@pytest.mark.anyio
+async def test_conditional_request():
+    from fastapi import FastAPI
+    from main import STATIC_ROOT
+
+    import fastapi_cdn_host
+
+    app = FastAPI(title="Conditional")
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT, cache_control="max-age=60")
+    async with TestClient(app) as c:
+        response = await c.get("/docs")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "max-age=60"
+        etag, last_modified = (
+            response.headers["etag"],
+            response.headers["last-modified"],
+        )
+        for headers in (
+            {"If-None-Match": etag},
+            {"If-None-Match": f'"other", W/{etag}'},
+            {"If-None-Match": "*"},
+            {"If-Modified-Since": last_modified},
+        ):
+            response = await c.get("/docs", headers=headers)
+            assert response.status_code == 304, headers
+            assert response.headers["etag"] == etag
+            assert not response.content
+        for headers in (
+            {"If-None-Match": '"other"'},
+            {"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"},
+            {"If-Modified-Since": "invalid"},
+            # If-None-Match takes precedence over If-Modified-Since
+            {"If-None-Match": '"other"', "If-Modified-Since": last_modified},
+        ):
+            response = await c.get("/docs", headers=headers)
+            assert response.status_code == 200, headers
+
+
+@pytest.mark.anyio
+async def test_resource_hints():
+    from fastapi import FastAPI
+    from main import STATIC_ROOT
+
+    import fastapi_cdn_host
+
+    app = FastAPI(title="Local", root_path="/api")
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT)
+    async with TestClient(app) as c:
+        links = (await c.get("/docs")).headers["link"]
+        redoc_links = (await c.get("/redoc")).headers["link"]
+    assert "rel=preconnect" not in links
+    assert "</api/static/swagger-ui.css>; rel=preload; as=style" in links
+    assert "</api/openapi.json>; rel=preload; as=fetch; crossorigin" in links
+    assert "redoc.standalone.js>; rel=preload; as=script" in redoc_links
+    app = FastAPI(title="No hints")
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT, resource_hints=False)
+    async with TestClient(app) as c:
+        assert "link" not in (await c.get("/docs")).headers
+
+
+@pytest.mark.anyio
+async def test_early_hints():
+    from fastapi import FastAPI
+
+    import fastapi_cdn_host
+    from fastapi_cdn_host import AssetUrl
+
+    urls = AssetUrl(
+        css="https://a.com/swagger-ui.css",
+        js="https://a.com/swagger-ui-bundle.js",
+        redoc="https://b.com/redoc.standalone.js",
+    )
+    app = FastAPI(title="Early hints")
+    fastapi_cdn_host.patch_docs(app, urls, early_hints=True)
+
+    async def get(path: str, extensions: dict) -> list[dict]:
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "server": ("test", 80),
+            "extensions": extensions,
+        }
+        messages: list[dict] = []
+
+        async def receive() -> dict:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: dict) -> None:
+            messages.append(message)
+
+        await app(scope, receive, send)
+        return messages
+
+    messages = await get("/docs", {"http.response.early_hint": {}})
+    assert messages[0]["type"] == "http.response.early_hint"
+    assert messages[0]["links"] == [
+        b"<https://a.com>; rel=preconnect",
+        b"<https://a.com/swagger-ui.css>; rel=preload; as=style",
+        b"<https://a.com/swagger-ui-bundle.js>; rel=preload; as=script",
+        b"</openapi.json>; rel=preload; as=fetch; crossorigin",
+    ]
+    assert messages[1]["type"] == "http.response.start"
+    assert messages[1]["status"] == 200
+    messages = await get("/redoc", {})
+    assert messages[0]["type"] == "http.response.start"
+    headers = dict(messages[0]["headers"])
+    assert b"<https://b.com>; rel=preconnect" in headers[b"link"]
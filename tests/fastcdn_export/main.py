@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+
+import fastapi_cdn_host
+
+app = FastAPI(title="FastAPI CDN host test")
+STATIC_ROOT = Path(__file__).parent.parent / "static_auto" / "static"
+
+
+@app.get("/items", tags=["item"])
+async def get_items() -> list[str]:
+    return ["a"]
+
+
+@app.get("/users", tags=["user"])
+async def get_users() -> list[str]:
+    return ["b"]
+
+
+fastapi_cdn_host.patch_docs(app, STATIC_ROOT, split_by_tag=True)
+
+CDN = "https://cdn.example.com"
+app_cdn = FastAPI(title="Assets from cdn")
+fastapi_cdn_host.patch_docs(
+    app_cdn,
+    fastapi_cdn_host.AssetUrl(
+        css=CDN + "/ui/swagger-ui.css",
+        js=CDN + "/ui/swagger-ui-bundle.js",
+        redoc=CDN + "/redoc/redoc.standalone.js",
+        favicon=CDN + "/favicon.png",
+    ),
+)
+cdn = FastAPI()
+
+
+@cdn.get("/{path:path}")
+async def cdn_asset(path: str) -> PlainTextResponse:
+    if path.endswith(".png"):
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(f"/* {path} */")
@@ -0,0 +1,69 @@
+import gzip
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from main import CDN, app, app_cdn, cdn
+
+from fastapi_cdn_host.cli import SiteExporter
+from fastapi_cdn_host.client import ClientProvider
+
+
+@pytest.mark.anyio
+async def test_export(tmp_path: Path):
+    paths = await SiteExporter(app, tmp_path).export()
+    assert len(paths) == len(set(paths)) == 11  # redoc js is missing in STATIC_ROOT
+    html = (tmp_path / "docs" / "index.html").read_text()
+    (css,) = (tmp_path / "static").glob("swagger-ui.*.css")
+    (js,) = (tmp_path / "static").glob("swagger-ui-bundle.*.js")
+    assert f'"/static/{css.name}"' in html
+    assert f'"/static/{js.name}"' in html
+    assert (
+        css.read_bytes()
+        == (
+            Path(__file__).parent.parent / "static_auto" / "static" / "swagger-ui.css"
+        ).read_bytes()
+    )
+    assert "/openapi/item.json" in html
+    redoc = (tmp_path / "redoc" / "index.html").read_text()
+    assert "/openapi.json" in redoc
+    oauth2_redirect = tmp_path / "docs" / "oauth2-redirect" / "index.html"
+    assert "oauth2RedirectUrl" in html
+    assert "window.opener.swaggerUIRedirectOauth2" in oauth2_redirect.read_text()
+    spec = json.loads((tmp_path / "openapi.json").read_bytes())
+    assert set(spec["paths"]) == {"/items", "/users"}
+    gz = (tmp_path / "openapi.json.gz").read_bytes()
+    assert json.loads(gzip.decompress(gz)) == spec
+    item = json.loads((tmp_path / "openapi" / "item.json").read_bytes())
+    assert list(item["paths"]) == ["/items"]
+    assert (tmp_path / "openapi" / "user.json.gz").exists()
+
+
+@pytest.mark.anyio
+async def test_export_cdn_assets(tmp_path: Path, mocker):
+    mocker.patch.object(
+        ClientProvider, "build", return_value=AsyncClient(transport=ASGITransport(cdn))
+    )
+    await SiteExporter(app_cdn, tmp_path).export()
+    (css,) = tmp_path.glob("assets/cdn.example.com/ui/swagger-ui.*.css")
+    assert css.read_text() == "/* ui/swagger-ui.css */"
+    assert list(tmp_path.glob("assets/cdn.example.com/redoc/redoc.standalone.*.js"))
+    html = (tmp_path / "docs" / "index.html").read_text()
+    assert f'"/assets/cdn.example.com/ui/{css.name}"' in html
+    assert CDN + "/ui/" not in html
+    assert f'"{CDN}/favicon.png"' in html  # Missing one is kept as is
+    redoc = (tmp_path / "redoc" / "index.html").read_text()
+    assert '"/assets/cdn.example.com/redoc/redoc.standalone.' in redoc
+
+
+def test_export_command(tmp_path: Path):
+    out = tmp_path / "site"
+    r = subprocess.run(
+        ["fastcdn", "export", "main.py", f"--out={out}"],
+        cwd=Path(__file__).parent,
+    )
+    assert r.returncode == 0
+    assert (out / "docs" / "index.html").exists()
+    assert (out / "openapi.json").exists()
@@ -1,3 +1,4 @@
+import json
 import shutil
 import subprocess
 from collections.abc import Generator
@@ -26,4 +27,6 @@ def prepare():
         r = subprocess.run(["fastcdn", "offline"])
         assert r.returncode == 0
         assert static_root.exists()
+        manifest = json.loads(static_root.joinpath("asset-manifest.json").read_text())
+        assert set(manifest) == {"css", "js", "redoc", "favicon"}
         yield
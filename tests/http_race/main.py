@@ -33,3 +33,8 @@ async def wait_for(seconds) -> dict:
 @app.get("/error")
 async def raise_exp():
     raise HTTPException(detail="foo", status_code=400)
+
+
+@app.head("/head")
+async def head():
+    return None
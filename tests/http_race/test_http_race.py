@@ -1,12 +1,23 @@
 # mypy: no-disallow-untyped-decorators
+import logging
+import math
+import threading
 import time
+from pathlib import Path
 
+import anyio
 import pytest
 from httpx import AsyncClient
 from main import app
 from utils import UvicornServer
 
-from fastapi_cdn_host.client import HttpSniff
+from fastapi_cdn_host.client import (
+    BytesCache,
+    ClientProvider,
+    HttpSniff,
+    PhaseTimings,
+    RaceSample,
+)
 from fastapi_cdn_host.utils import TestClient
 
 try:
@@ -55,3 +66,225 @@ async def test_find():
         assert fastest == urls[0]
         fastest = await timeit(HttpSniff.find_fastest_host)(urls, loop_interval=0.1)
         assert fastest == urls[waits.index(min(waits))]
+
+
+@pytest.mark.anyio
+async def test_first_response_wins():
+    waits = (0.5, 0.05, 0.3)
+    host = "http://127.0.0.1:8000/"
+    with UvicornServer().run_in_thread():
+        urls = [host + f"delay/{seconds}" for seconds in waits]
+        start = time.perf_counter()
+        fastest = await HttpSniff.find_fastest_host(urls)
+        assert fastest == urls[1]
+        assert time.perf_counter() - start < 0.3
+        start = time.perf_counter()
+        fast_hosts = await HttpSniff.get_fast_hosts(urls)
+        assert fast_hosts == urls[1:]
+        assert time.perf_counter() - start < 0.5
+        assert await HttpSniff.get_fast_hosts([]) == []
+
+
+@pytest.mark.anyio
+async def test_probe(client: AsyncClient):
+    results: list = [None]
+    await HttpSniff.probe(client, "/error", results, 0)
+    assert results[0] is None
+    await HttpSniff.probe(client, "/head/", results, 0, "head")
+    assert results[0] is None
+    await HttpSniff.probe(client, "/wait/0.1", results, 0)
+    assert isinstance(results[0], RaceSample)
+    assert results[0].ttfb >= 0.1
+    assert results[0].phases is not None
+    assert "/wait/0.1" not in HttpSniff.cached
+    results = [None]
+    await HttpSniff.probe(client, "/head", results, 0, "head")
+    assert isinstance(results[0], RaceSample)
+
+
+@pytest.mark.anyio
+async def test_race_report():
+    host = "http://127.0.0.1:8000/"
+    urls = [host + "delay/0.2", host + "wait/0.05", host + "error"]
+    with UvicornServer().run_in_thread():
+        report = await HttpSniff.race(urls, samples=3)
+        assert report.chosen == urls[1]
+        slow, fast, error = report.hosts
+        assert len(fast.samples) == len(slow.samples) == 3
+        assert fast.p50 < slow.p50 <= slow.p95
+        assert fast.samples[0].size > 0
+        assert not error.samples and len(error.errors) == 3
+        assert "400" in error.errors[0]
+        assert error.p50 == math.inf
+        assert report[urls[1]] is fast
+        with pytest.raises(KeyError):
+            report["not-exist"]
+        assert report.choose(lambda h: -h.p50) == urls[0]
+        report = await HttpSniff.race(urls, samples=2, probe="head")
+        assert report.chosen is None  # HEAD is not allowed
+        assert all(h.errors for h in report.hosts)
+        report = await HttpSniff.race(urls[:2], samples=5, total_seconds=0.3)
+        assert report.chosen == urls[1]
+        assert len(report.hosts[0].samples) == 1
+
+
+def test_bytes_cache(mocker):
+    cache = BytesCache(max_bytes=10, ttl=60)
+    cache["a"] = b"1234"
+    cache["b"] = b"5678"
+    assert cache["a"] == b"1234"  # 'a' becomes the most recently used one
+    cache["c"] = b"90"
+    assert cache.size == 10
+    cache["d"] = b"x"
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert list(cache._data) == ["a", "c", "d"]
+    cache["e"] = b"x" * 11  # Too large to be cached
+    assert "e" not in cache
+    cache["a"] = b"12"
+    assert cache.size == 5
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(KeyError):
+        cache["not-exist"]
+    del cache["a"]
+    assert len(cache) == 2
+    now = time.monotonic()
+    mocker.patch("time.monotonic", return_value=now + 61)
+    assert cache.get("c") is None
+    assert "d" not in cache
+    cache.clear()
+    assert len(cache) == cache.size == cache.hits == cache.misses == 0
+
+
+def test_bytes_cache_threads():
+    cache = BytesCache(max_bytes=1000)
+
+    def worker(n: int) -> None:
+        for i in range(200):
+            cache[f"{n}-{i}"] = b"x" * 10
+            cache.get(f"{n}-{i - 1}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.size == sum(len(v) for v, _ in cache._data.values()) == 1000
+
+
+@pytest.mark.anyio
+async def test_client_provider():
+    provider = ClientProvider(timeout=2)
+    assert provider.current is None
+    async with provider.session() as client:
+        assert provider.current is client
+        assert client.timeout.read == 2
+        async with provider.session(timeout=10) as c:
+            assert c is client
+        shared = []
+
+        async def child() -> None:
+            async with provider.session() as c:
+                shared.append(c)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(child)
+            tg.start_soon(child)
+        assert shared == [client, client]
+        assert not client.is_closed
+    assert client.is_closed
+    assert provider.current is None
+    async with provider.session(timeout=10) as c:
+        assert c is not client
+        assert c.timeout.read == 10
+    assert provider.ssl_context is provider.ssl_context
+
+
+def test_ssl_cert_file_env(monkeypatch, tmp_path):
+    import certifi
+
+    bundle = Path(certifi.where()).read_text()
+    end = "-----END CERTIFICATE-----"
+    cafile = tmp_path / "ca.pem"
+    cafile.write_text(bundle[: bundle.index(end) + len(end)] + "\n")
+    monkeypatch.setenv("SSL_CERT_FILE", str(cafile))
+    assert ClientProvider().ssl_context.cert_store_stats()["x509_ca"] == 1
+
+
+def test_http2_fallback(mocker):
+    mocker.patch("importlib.util.find_spec", return_value=None)
+    assert ClientProvider(http2=True).http2_enabled is False
+    assert ClientProvider().http2_enabled is False
+
+
+@pytest.mark.anyio
+async def test_shared_client(mocker):
+    host = "http://127.0.0.1:8000/"
+    urls = [host + "delay/0.01", host + "wait/0.01"]
+    build = mocker.spy(HttpSniff.client_provider, "build")
+    with UvicornServer().run_in_thread():
+        async with HttpSniff.client_provider.session() as client:
+            await HttpSniff.get_fast_hosts(urls)
+            await HttpSniff.race(urls, samples=2)
+            await HttpSniff.bulk_fetch(urls, get_content=True)
+        assert build.call_count == 1
+        assert client.is_closed
+        await HttpSniff.find_fastest_host(urls)
+        assert build.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_phase_timings(caplog):
+    host = "http://127.0.0.1:8000/"
+    urls = [host + "wait/0.05", host + "error"]
+    with (
+        UvicornServer().run_in_thread(),
+        caplog.at_level(logging.DEBUG, logger="fastapi-cdn-host"),
+    ):
+        report = await HttpSniff.race(urls, samples=2)
+    first, second = report.hosts[0].samples
+    assert first.phases is not None and second.phases is not None
+    assert first.phases.dns is not None and second.phases.dns is None
+    assert first.phases.connect is not None
+    assert second.phases.connect is None  # keep-alive connection reused
+    assert first.phases.tls is None  # not https
+    assert first.phases.ttfb is not None and first.phases.ttfb >= 0.05
+    assert first.phases.transfer is not None
+    median = report.hosts[0].phases
+    assert median.ttfb is not None and median.connect == first.phases.connect
+    assert "connect=" in str(median) and "tls=-" in str(median)
+    assert f"* {urls[0]}: p50=" in caplog.text
+    assert f"{urls[1]}: failed" in caplog.text
+    assert str(PhaseTimings.median([])) == "dns=- connect=- tls=- ttfb=- transfer=-"
+    timings: dict[str, float] = {}
+    samples: dict[str, RaceSample] = {}
+    with (
+        UvicornServer().run_in_thread(),
+        caplog.at_level(logging.DEBUG, logger="fastapi-cdn-host"),
+    ):
+        fastest = await HttpSniff.find_fastest_host(
+            urls, timings=timings, samples=samples
+        )
+    assert fastest == urls[0] and list(samples) == [urls[0]]
+    assert timings[urls[0]] == samples[urls[0]].ttfb
+    assert samples[urls[0]].phases is not None
+    assert f"Fastest host {urls[0]}: dns=" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_accept_ms():
+    host = "http://127.0.0.1:8000/"
+    fast, slow, error = host + "wait/0.01", host + "delay/0.5", host + "error"
+    with UvicornServer().run_in_thread():
+        # The first one is fast enough, so the faster second one is not requested
+        urls = [host + "delay/0.05", fast]
+        assert await HttpSniff.find_fastest_host(urls, accept_ms=200) == urls[0]
+        assert await HttpSniff.find_fastest_host(urls) == fast
+        start = time.perf_counter()
+        assert await HttpSniff.find_fastest_host([slow, fast], accept_ms=50) == fast
+        assert time.perf_counter() - start < 0.4
+        start = time.perf_counter()
+        assert await HttpSniff.find_fastest_host([error, fast], accept_ms=1000) == fast
+        assert time.perf_counter() - start < 0.5
+        urls = [error, host + "not-exist"]
+        assert await HttpSniff.find_fastest_host(urls, accept_ms=10) == error
@@ -1,9 +1,13 @@
 # mypy: no-disallow-untyped-decorators
 import random
 import sys
+import time
 from datetime import datetime
+from functools import partial
 
+import anyio
 import pytest
+from fastapi import FastAPI, HTTPException, Request
 from httpx import AsyncClient
 from main import (
     app,
@@ -17,7 +21,9 @@ from main import (
     app_weekday,
 )
 
-from fastapi_cdn_host.utils import TestClient
+import fastapi_cdn_host
+from fastapi_cdn_host.client import AssetUrl, CompiledLock, DocsBuilder
+from fastapi_cdn_host.utils import ParamLock, TestClient, weekday_lock
 
 
 @pytest.fixture(scope="module")
@@ -58,6 +64,14 @@ class LockTester:
         assert response.status_code == 200
         response = await client.get(f"/redoc?{param_name}={day}")
         assert response.status_code == 200
+        assert response.headers["cache-control"] == "private, no-cache"
+        # Lock runs before conditional request is checked
+        headers = {"If-None-Match": response.headers["etag"]}
+        response = await client.get("/redoc", headers=headers)
+        assert response.status_code == status_code
+        response = await client.get(f"/redoc?{param_name}={day}", headers=headers)
+        assert response.status_code == 304
+        assert not response.content
         response = await client.get("/")
         assert response.status_code == 200
         assert response.text == '"homepage"'
@@ -168,3 +182,154 @@ class TestParamLock(LockTester):
         await self.request_locked(client_param_lock, "a")
         await self.request_locked(client_param_lock, "a")
         await self.request_locked(client_param_lock, "a")
+
+
+class AsyncParamLock(ParamLock):
+    async def __call__(self, request: Request) -> None:
+        self.check_param(request, self.name, self.exclude_localhost)
+
+
+async def async_lock(request: Request, name: str) -> None:
+    ParamLock.check_param(request, name, exclude_localhost=False)
+
+
+class CountingLock(ParamLock):
+    def __init__(self, *args, **kw) -> None:
+        super().__init__(*args, **kw)
+        self.calls = 0
+
+    def __call__(self, request: Request) -> None:
+        self.calls += 1
+        super().__call__(request)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "lock",
+    [AsyncParamLock(exclude_localhost=False), partial(async_lock, name="a")],
+)
+async def test_async_callable_lock(lock):
+    app = FastAPI()
+    fastapi_cdn_host.patch_docs(app, lock=lock)
+    async with TestClient(app) as client:
+        for path in ("/docs", "/redoc"):
+            response = await client.get(path)
+            assert response.status_code == 418
+            response = await client.get(path + "?a=1")
+            assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_lock_cache(mocker):
+    app = FastAPI()
+    lock = CountingLock(exclude_localhost=False)
+    fastapi_cdn_host.patch_docs(app, lock=lock, lock_cache_ttl=60)
+    async with TestClient(app) as client:
+        for _ in range(3):
+            response = await client.get("/docs?a=1")
+            assert response.status_code == 200
+        assert lock.calls == 1
+        response = await client.get("/docs?a=2")  # Another credential
+        assert response.status_code == 200
+        assert lock.calls == 2
+        for _ in range(2):  # Failed verdict is not cached
+            response = await client.get("/docs")
+            assert response.status_code == 418
+        assert lock.calls == 4
+        mocker.patch("time.monotonic", return_value=time.monotonic() + 61)
+        response = await client.get("/redoc?a=1")  # Expired
+        assert response.status_code == 200
+        assert lock.calls == 5
+
+
+@pytest.mark.anyio
+async def test_lock_cache_key():
+    calls: list[str] = []
+
+    async def api_key_lock(request: Request) -> None:
+        calls.append(key := request.headers.get("x-api-key", ""))
+        if key != "secret":
+            raise HTTPException(status_code=401)
+
+    app = FastAPI()
+    fastapi_cdn_host.patch_docs(
+        app,
+        lock=api_key_lock,
+        lock_cache_ttl=60,
+        lock_cache_key=lambda req: req.headers.get("x-api-key", ""),
+    )
+    async with TestClient(app) as client:
+        for _ in range(2):
+            response = await client.get("/docs", headers={"X-Api-Key": "secret"})
+            assert response.status_code == 200
+        assert calls == ["secret"]
+        # Same client host, but without the api key
+        assert (await client.get("/docs")).status_code == 401
+        assert calls == ["secret", ""]
+
+
+@pytest.mark.anyio
+async def test_raw_lock_compiled_once(mocker):
+    app = FastAPI()
+    index = [getattr(r, "path", "") for r in app.routes].index("/docs")
+    urls = AssetUrl(css="a.css", js="a.js", redoc="a.redoc.js")
+    compile_lock = mocker.spy(CompiledLock, "__init__")
+    DocsBuilder(index).update_docs_entrypoint(urls, app, "/docs", lock=slow_lock)
+    assert compile_lock.call_count == 1
+    async with TestClient(app) as client:
+        for _ in range(3):
+            assert (await client.get("/docs")).status_code == 200
+    assert compile_lock.call_count == 1
+
+
+def slow_lock(request: Request) -> None:
+    time.sleep(float(request.query_params.get("sleep", 0)))
+
+
+@pytest.mark.anyio
+async def test_sync_lock_in_thread():
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping() -> str:
+        return "pong"
+
+    fastapi_cdn_host.patch_docs(app, lock=slow_lock, lock_timeout=0.4)
+    async with TestClient(app) as client:
+        pings: list[float] = []
+
+        async def request_ping() -> None:
+            await anyio.sleep(0.05)
+            start = time.perf_counter()
+            assert (await client.get("/ping")).text == '"pong"'
+            pings.append(time.perf_counter() - start)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(client.get, "/docs?sleep=0.2")
+            tg.start_soon(request_ping)
+        assert pings[0] < 0.2  # Event loop was not blocked by the lock
+        start = time.perf_counter()
+        response = await client.get("/redoc?sleep=1")
+        assert response.status_code == 503
+        assert time.perf_counter() - start < 0.8
+    assert CompiledLock(ParamLock()).in_thread is False
+    assert CompiledLock(partial(weekday_lock, name="d")).in_thread is False
+    assert CompiledLock(slow_lock, threads=None).in_thread is False
+    assert CompiledLock(slow_lock).in_thread is True
+
+    class LdapLock(ParamLock):  # May do blocking IO in `validate`
+        pass
+
+    assert CompiledLock(LdapLock()).in_thread is True
+
+
+@pytest.mark.anyio
+async def test_lock_threads_bounded_on_timeout():
+    app = FastAPI()
+    fastapi_cdn_host.patch_docs(app, lock=slow_lock, lock_threads=1, lock_timeout=0.2)
+    async with TestClient(app) as client:
+        assert (await client.get("/docs?sleep=0.6")).status_code == 503
+        # The abandoned thread still holds the only slot
+        assert (await client.get("/docs")).status_code == 503
+        await anyio.sleep(0.5)
+        assert (await client.get("/docs")).status_code == 200
@@ -8,7 +8,7 @@ from fastapi import FastAPI
 from httpx import AsyncClient
 from main import app
 
-from fastapi_cdn_host.client import StaticBuilder, monkey_patch_for_docs_ui
+from fastapi_cdn_host.client import StaticBuilder, StaticIndex, monkey_patch_for_docs_ui
 from fastapi_cdn_host.utils import TestClient
 
 default_favicon_url = "https://fastapi.tiangolo.com/img/favicon.png"
@@ -39,3 +39,49 @@ def test_get_latest_one(tmp_path: Path):
     time.sleep(0.1)
     (b := tmp_path / "b.txt").touch()
     assert StaticBuilder.get_latest_one([a, b]) == b
+
+
+def test_static_index(tmp_path: Path):
+    (sub := tmp_path / "swagger" / "v5").mkdir(parents=True)
+    (sub / "swagger-ui.css").touch()
+    (sub / "swagger-ui-bundle.js").touch()
+    (tmp_path / "favicon.ico").touch()
+    (tmp_path / "favicon.png").touch()
+    (hidden := tmp_path / ".git").mkdir()
+    (hidden / "redoc.standalone.js").touch()
+    (deep := tmp_path.joinpath(*"abcdef")).mkdir(parents=True)
+    (deep / "redoc.standalone.js").touch()
+    index = StaticIndex.scan(tmp_path)
+    assert index.latest("css") == sub / "swagger-ui.css"
+    assert index.latest("js") == sub / "swagger-ui-bundle.js"
+    assert index.latest("favicon") == tmp_path / "favicon.png"
+    assert index.latest("redoc") is None  # Ignored or too deep
+    assert StaticIndex.scan(tmp_path, max_depth=6).latest("redoc") == deep / (
+        "redoc.standalone.js"
+    )
+    urls = StaticBuilder(FastAPI(), tmp_path).find()
+    assert urls is not None
+    assert urls.css == "/static/swagger/v5/swagger-ui.css"
+    assert urls.redoc == "/static/swagger/v5/redoc.standalone.js"
+    assert urls.favicon == "/static/favicon.png"
+    # Manifest is preferred to scanning
+    StaticIndex.write_manifest(
+        tmp_path,
+        {
+            "css": "swagger/v5/swagger-ui.css",
+            "js": None,
+            "redoc": "a/b/c/d/e/f/redoc.standalone.js",
+        },
+    )
+    index = StaticIndex.load(tmp_path)
+    assert index.latest("redoc") == deep / "redoc.standalone.js"
+    assert index.latest("js") is None
+    # Kinds that not recorded in manifest are scanned
+    assert index.latest("favicon") == tmp_path / "favicon.png"
+    urls = StaticBuilder(FastAPI(), tmp_path).find()
+    assert urls is not None
+    assert urls.favicon == "/static/favicon.png"
+    StaticIndex.write_manifest(tmp_path, {"css": "swagger/v5/swagger-ui.css"})
+    assert StaticIndex.load(tmp_path).latest("js") == sub / "swagger-ui-bundle.js"
+    StaticIndex.write_manifest(tmp_path, {"css": "not-exist.css"})
+    assert StaticIndex.load(tmp_path).latest("js") == sub / "swagger-ui-bundle.js"
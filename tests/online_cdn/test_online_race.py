@@ -50,3 +50,12 @@ async def test_docs(client: AsyncClient):  # nosec
         assert urls.redoc in text2
     response = await client.get("/app")
     assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_race_the_fastest():
+    urls, report = await CdnHostBuilder.race_the_fastest(samples=2)
+    assert len(report.hosts) == len(CdnHostEnum)
+    if report.chosen is not None:
+        assert urls.css == report.chosen
+        assert report[report.chosen].samples
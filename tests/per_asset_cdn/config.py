@@ -0,0 +1,4 @@
+PORT = 8619
+MY_CDN = f"http://127.0.0.1:{PORT}/cdn"
+HOST_A = MY_CDN + "/a"  # swagger-ui.css and redoc.standalone.js
+HOST_B = MY_CDN + "/b"  # swagger-ui-bundle.js
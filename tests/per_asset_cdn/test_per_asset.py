@@ -0,0 +1,59 @@
+# mypy: no-disallow-untyped-decorators
+import sys
+import time
+from pathlib import Path
+
+import anyio
+import pytest
+from config import HOST_A, HOST_B, PORT
+from main import app, choices, patch
+
+from fastapi_cdn_host.client import CdnHostBuilder, HostStats, HttpSniff, RaceReport
+from fastapi_cdn_host.utils import TestClient
+
+try:
+    from tests.http_race.utils import UvicornServer
+except ImportError:
+    _path = Path(__file__).parent.parent / "http_race"
+    sys.path.append(_path.as_posix())
+    from utils import UvicornServer  # type: ignore[no-redef]
+
+
+@pytest.mark.anyio
+async def test_race_per_asset():
+    with UvicornServer("media_server:app", port=PORT).run_in_thread():
+        urls, reports = await CdnHostBuilder.race_per_asset(choices=choices)
+    assert urls.css == HOST_A + "/swagger-ui.css"
+    assert urls.js == HOST_B + "/swagger-ui-bundle.js"
+    assert urls.redoc == HOST_A + "/redoc.standalone.js"
+    assert reports["js"][urls.js].throughput > 0
+    assert reports["js"][HOST_A + "/swagger-ui-bundle.js"].errors
+    assert sorted(reports) == ["css", "js", "redoc"]
+
+
+@pytest.mark.anyio
+async def test_race_assets_concurrently(mocker):
+    async def slow_race(urls, *args, **kw) -> RaceReport:
+        await anyio.sleep(0.2)
+        return RaceReport([HostStats(url) for url in urls])
+
+    mocker.patch.object(HttpSniff, "race", side_effect=slow_race)
+    start = time.perf_counter()
+    urls, reports = await CdnHostBuilder.race_per_asset(choices=choices)
+    assert time.perf_counter() - start < 0.4
+    assert urls.css == reports["css"].chosen == HOST_A + "/swagger-ui.css"
+
+
+@pytest.mark.anyio
+async def test_docs():
+    with UvicornServer("media_server:app", port=PORT).run_in_thread():
+        patch(app)
+    async with TestClient(app) as client:
+        response = await client.get("/docs")
+        text = response.text
+        assert response.status_code == 200, text
+        assert f'"{HOST_A}/swagger-ui.css"' in text
+        assert f'"{HOST_B}/swagger-ui-bundle.js"' in text
+        response = await client.get("/redoc")
+        assert response.status_code == 200, response.text
+        assert f'"{HOST_A}/redoc.standalone.js"' in response.text
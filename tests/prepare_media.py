@@ -34,6 +34,10 @@ def main():
     copy_file(pri_cdn2 / "redoc@2/bundles", redoc_file)
     simple_path = root / "simple_asset_path/cdn"
     copy_file(simple_path, redoc_file, favicon_file, *swagger_ui_files)
+    per_asset = root / "per_asset_cdn/cdn"
+    css_file = src / "swagger-ui.css"
+    copy_file(per_asset / "a", css_file, redoc_file)
+    copy_file(per_asset / "b", src / "swagger-ui-bundle.js")
 
 
 if __name__ == "__main__":
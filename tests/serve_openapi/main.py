@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+import fastapi_cdn_host
+from fastapi_cdn_host.utils import ParamLock
+
+STATIC_ROOT = Path(__file__).parent.parent / "static_auto" / "static"
+app = FastAPI(title="FastAPI CDN host test")
+app_lock = FastAPI(title="FastAPI CDN host test with lock", root_path="/api")
+
+for i in range(100):
+
+    @app.get(f"/items/{i}/{{item_id}}", summary=f"Read item of group {i}")
+    @app_lock.get(f"/items/{i}/{{item_id}}")
+    async def read_item(item_id: int, q: str | None = None) -> dict:
+        return {"item_id": item_id, "q": q}
+
+
+app_split = FastAPI(
+    title="FastAPI CDN host test with split spec",
+    openapi_tags=[{"name": "users"}, {"name": "items"}],
+)
+
+
+class User(BaseModel):
+    name: str
+
+
+class Item(BaseModel):
+    title: str
+    owner: User
+
+
+@app_split.get("/items/", tags=["items"])
+async def read_items() -> list[Item]:
+    return []
+
+
+@app_split.get("/users/", tags=["users"])
+async def read_users() -> list[User]:
+    return []
+
+
+@app_split.get("/health")
+async def health() -> dict:
+    return {}
+
+
+fastapi_cdn_host.patch_docs(app, STATIC_ROOT, serve_openapi=True)
+fastapi_cdn_host.patch_docs(app_split, STATIC_ROOT, split_by_tag=True)
+fastapi_cdn_host.patch_docs(
+    app_lock,
+    STATIC_ROOT,
+    lock=ParamLock(exclude_localhost=False),
+    serve_openapi=True,
+)
+
+
+if __name__ == "__main__":
+    uvicorn.run("__main__:app", reload=True)
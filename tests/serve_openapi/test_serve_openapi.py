@@ -0,0 +1,167 @@
+# mypy: no-disallow-untyped-decorators
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from main import STATIC_ROOT, app, app_lock, app_split
+
+import fastapi_cdn_host
+from fastapi_cdn_host.client import OpenapiSplitter
+from fastapi_cdn_host.utils import TestClient
+
+
+@pytest.fixture(scope="module")
+async def client():
+    async with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+async def client_lock():
+    async with TestClient(app_lock) as c:
+        yield c
+
+
+@pytest.mark.anyio
+async def test_openapi(client: AsyncClient, mocker):
+    identity = {"Accept-Encoding": "identity"}
+    response = await client.get("/openapi.json", headers=identity)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == app.openapi()
+    etag = response.headers["etag"]
+    # Serialized only once
+    openapi = mocker.spy(app, "openapi")
+    response = await client.get("/openapi.json", headers={"Accept-Encoding": "gzip"})
+    assert openapi.call_count == 0
+    assert response.headers["content-encoding"] == "gzip"
+    gzip_etag = response.headers["etag"]
+    assert gzip_etag != etag
+    assert json.loads(response.content) == app.openapi()  # httpx decodes it
+    assert int(response.headers["content-length"]) < len(json.dumps(app.openapi()))
+    # Conditional requests
+    response = await client.get(
+        "/openapi.json", headers={**identity, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    response = await client.get(
+        "/openapi.json", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    response = await client.get(
+        "/openapi.json",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag},
+    )
+    assert response.status_code == 304
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_openapi_lock(client_lock: AsyncClient):
+    response = await client_lock.get("/openapi.json")
+    assert response.status_code == 418
+    response = await client_lock.get("/openapi.json?a=1")
+    assert response.status_code == 200
+    assert response.json()["servers"] == [{"url": "/api"}]
+    assert response.headers["cache-control"] == "private, no-cache"
+    # Query params of docs page are passed to the openapi url, so that lock can pass
+    response = await client_lock.get("/docs?a=1")
+    assert "url: '/api/openapi.json?a=1'" in response.text
+    response = await client_lock.get("/redoc?a=2")
+    assert 'spec-url="/api/openapi.json?a=2"' in response.text
+    # Hostile query string is escaped rather than injected into the page
+    response = await client_lock.get("/docs?a=1&x=';alert(document.domain);//")
+    assert "alert(document.domain)" not in response.text
+    assert "url: '/api/openapi.json?a=1&x=%27%3Balert%28document.domain" in (
+        response.text
+    )
+    response = await client_lock.get('/redoc?a=2&x="><script>alert(1)</script>')
+    assert "<script>alert(1)" not in response.text
+    assert 'spec-url="/api/openapi.json?a=2&x=%22%3E%3Cscript%3E' in response.text
+
+
+@pytest.fixture(scope="module")
+async def client_split():
+    async with TestClient(app_split) as c:
+        yield c
+
+
+@pytest.mark.anyio
+async def test_split_by_tag(client_split: AsyncClient):
+    response = await client_split.get("/docs")
+    text = response.text
+    assert "url: '/openapi/users.json'" in text
+    # Swagger-ui does not load `url` on startup if `urls` is set
+    config = text.split("SwaggerUIBundle({", 1)[1].split("})", 1)[0]
+    assert "urls" not in config
+    assert 'id="spec-selector"' in text
+    for name in ("users", "items", "default", "All"):
+        assert f">{name}</option>" in text
+    assert "</openapi/users.json>; rel=preload" in response.headers["link"]
+    assert '"docExpansion"' not in text  # Not a large spec
+    spec = (await client_split.get("/openapi/items.json")).json()
+    assert list(spec["paths"]) == ["/items/"]
+    assert spec["tags"] == [{"name": "items"}]
+    assert set(spec["components"]["schemas"]) == {"Item", "User"}
+    spec = (await client_split.get("/openapi/users.json")).json()
+    assert set(spec["components"]["schemas"]) == {"User"}
+    spec = (await client_split.get("/openapi/default.json")).json()
+    assert list(spec["paths"]) == ["/health"]
+    response = await client_split.get("/openapi/missing.json")
+    assert response.status_code == 404
+    response = await client_split.get("/openapi.json")
+    assert len(response.json()["paths"]) == 3
+
+
+@pytest.mark.anyio
+async def test_split_by_tag_memo(mocker):
+    app = FastAPI()
+
+    @app.get("/users/", tags=["users"])
+    async def read_users() -> list:
+        return []
+
+    @app.get("/openapi/mine.json")
+    async def user_route() -> dict:
+        return {"user": "mine"}
+
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT, split_by_tag=True)
+    tags = mocker.spy(OpenapiSplitter, "tags")
+    async with TestClient(app) as client:
+        assert "url: '/openapi/users.json'" in (await client.get("/docs")).text
+        for _ in range(3):
+            response = await client.get("/openapi/users.json")
+            assert list(response.json()["paths"]) == ["/users/"]
+        # User route is not shadowed by the one of tags
+        response = await client.get("/openapi/mine.json")
+        assert response.json() == {"user": "mine"}
+    assert tags.call_count == 2  # Once for docs page, once for tag specs
+
+
+@pytest.mark.anyio
+async def test_broken_schema(mocker):
+    app = FastAPI()
+
+    @app.get("/users/", tags=["users"])
+    async def read_users() -> list:
+        return []
+
+    fastapi_cdn_host.patch_docs(app, STATIC_ROOT, split_by_tag=True)
+    mocker.patch.object(app, "openapi", side_effect=ValueError("broken"))
+    async with TestClient(app) as client:
+        response = await client.get("/docs")
+        assert response.status_code == 200
+        assert 'id="spec-selector"' not in response.text
+
+
+@pytest.mark.anyio
+async def test_large_spec(client: AsyncClient, mocker):
+    from fastapi_cdn_host.client import DocsBuilder
+
+    mocker.patch.object(DocsBuilder, "large_spec_operations", 99)
+    response = await client.get("/docs")
+    assert '"docExpansion": "none"' in response.text
+    assert '"defaultModelsExpandDepth": -1' in response.text
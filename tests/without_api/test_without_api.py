@@ -1,4 +1,5 @@
 # mypy: no-disallow-untyped-decorators
+import dataclasses
 import os
 import time
 import uuid
@@ -278,6 +279,14 @@ class TestParseAssetUrl:
         a = AssetUrl(css="", js="", redoc="", favicon="")
         assert _parse_asset_url(a, None, None, None) == a
 
+    def test_favicon(self):
+        a = AssetUrl(css="a.css", js="a.js", redoc="a.redoc.js")
+        b = _parse_asset_url(a, "b.ico", None, None)
+        assert b.favicon == "b.ico"
+        assert a.favicon is None
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            a.favicon = "c.ico"  # type:ignore[misc]
+
     def test_local(self, mock_builder, app):
         _parse_asset_url("local", None, False, app)
         mock_builder.assert_called_once_with(app, Path("static"), None, False)